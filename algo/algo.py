@@ -1,24 +1,88 @@
 import heapq
 import math
-from typing import List
-import numpy as np
+import time
+from contextlib import nullcontext
+from typing import List, Optional, Set, Tuple
 from entities.Robot import Robot
 from entities.Entity import Obstacle, CellState, Grid
 from consts import (
+    CELL_SIZE,
     Direction,
     MOVE_DIRECTION,
-    TURN_FACTOR,
-    ITERATIONS,
+    TURN_DISPLACEMENTS,
     TURN_RADIUS,
-    SAFE_COST,
 )
-from algo.tsp import solve_tsp_dynamic_programming
+from algo.cost_model import StepCostModel
+from algo.footprint import get_straight_sweep, get_turn_sweep, occupancy_raster
+from algo.successors import STATE_DIRECTIONS, SearchBuffers, SuccessorTable
+from algo.heuristic import HeuristicTable
+from algo.path_library import PathLibrary
+from algo.stats import PlannerStats
+from algo.tsp import SetTSPTables, solve_set_tsp_local_search
 
 turn_wrt_big_turns = [
     [3 * TURN_RADIUS, TURN_RADIUS],
     [4 * TURN_RADIUS, 2 * TURN_RADIUS],
 ]
 
+# Heuristic tables only depend on the grid size, cell size, turning mode and cost model, so they are shared by every
+# MazeSolver
+_heuristic_tables = dict()
+# Moves of every state of the obstacle-free grid, by grid size, cell size, turning mode and cost model, see
+# MazeSolver.get_successor_table
+_free_moves = dict()
+
+
+def get_scale(cell_size) -> int:
+    """Number of cells of the given size per cell of CELL_SIZE, in each direction
+
+    Args:
+        cell_size (float): size of a cell in cm, such as 10, 5 or 2.5
+
+    Returns:
+        int: scale of the grid
+
+    Raises:
+        ValueError: if CELL_SIZE is not a whole number of cells of the given size
+    """
+    scale = round(CELL_SIZE / cell_size)
+    if scale < 1 or scale * cell_size != CELL_SIZE:
+        raise ValueError(f"Cell size must divide {CELL_SIZE} cm, got {cell_size}")
+    return scale
+
+
+def warm_up(
+    size_x: int,
+    size_y: int,
+    big_turns=(0, 1),
+    heuristic=False,
+    cell_size=CELL_SIZE,
+    cost_model=None,
+    swept_footprint=False,
+):
+    """Build the tables shared by every MazeSolver ahead of the first plan, e.g. when a worker process starts
+
+    Args:
+        size_x (int): Size of the grid in the x direction
+        size_y (int): Size of the grid in the y direction
+        big_turns (Iterable[int], optional): turning modes to build the tables of. Defaults to both.
+        heuristic (bool, optional): whether to also build the heuristic tables of the "astar" and "bidirectional"
+            methods, which imports numpy. Defaults to False.
+        cell_size (float, optional): size of a cell in cm. Defaults to CELL_SIZE.
+        cost_model (optional): cost model of the moves, see MazeSolver. Defaults to StepCostModel.
+        swept_footprint (bool, optional): whether to also build the swept footprints of the moves, see MazeSolver.
+            Defaults to False.
+    """
+    for big_turn in big_turns:
+        solver = MazeSolver(
+            size_x, size_y, 1, 1, Direction.NORTH, big_turn=big_turn, cell_size=cell_size, cost_model=cost_model
+        )
+        solver.get_successor_table()
+        if swept_footprint:
+            solver._get_move_sweeps()
+        if heuristic:
+            solver.get_heuristic_table()
+
 
 class MazeSolver:
     def __init__(
@@ -29,18 +93,46 @@ class MazeSolver:
         robot_y: int,
         robot_direction: Direction,
         big_turn=None,  # the big_turn here is to allow 3-1 turn(0 - by default) | 4-2 turn(1)
+        path_library: Optional[PathLibrary] = None,  # precomputed paths of the obstacle-free grid, see PathLibrary
+        cell_size=CELL_SIZE,  # size of a cell in cm, finer cells (e.g. 5 or 2.5 for a 40x40 or 80x80 grid) scale up the turns and clearances
+        cost_model=None,  # cost of the moves that the plan minimises, StepCostModel (grid steps) by default, see algo.cost_model
+        swept_footprint=False,  # also drop the moves whose swept robot footprint hits an obstacle, see algo.footprint
     ):
+        # Number of cells per cell of CELL_SIZE, which the turns, clearance rules and view positions are scaled by
+        self.cell_size = cell_size
+        self.scale = get_scale(cell_size)
+        self.cost_model = cost_model if cost_model is not None else StepCostModel()
+        self.swept_footprint = swept_footprint
         # Initialize a Grid object for the arena representation
-        self.grid = Grid(size_x, size_y)
+        self.grid = Grid(size_x, size_y, self.scale)
         # Initialize a Robot object for robot representation
         self.robot = Robot(robot_x, robot_y, robot_direction)
-        # Create tables for paths and costs
+        # Create tables for paths and costs, keyed by (start, end) cell states and valid for one grid version
         self.path_table = dict()
         self.cost_table = dict()
+        self._tables_version = self.grid.version
         if big_turn is None:
             self.big_turn = 0
         else:
             self.big_turn = int(big_turn)
+        # Successor table of the grid, rebuilt when the grid version changes
+        self._successor_table = None
+        self._successor_table_version = None
+        # Timings and counters of the current plan, only collected if asked for
+        self.stats = None
+        if path_library is not None and (
+            (path_library.size_x, path_library.size_y, path_library.big_turn, path_library.scale)
+            != (size_x, size_y, self.big_turn, self.scale)
+        ):
+            raise ValueError(
+                f"Path library of a {path_library.size_x}x{path_library.size_y} grid with big_turn={path_library.big_turn} "
+                f"and scale={path_library.scale} cannot be used for a {size_x}x{size_y} grid with "
+                f"big_turn={self.big_turn} and scale={self.scale}"
+            )
+        if path_library is not None and self.cost_model.key != StepCostModel().key:
+            # Path libraries hold the costs of StepCostModel, see PathLibrary.get_path
+            raise ValueError("Path libraries can only be used with the StepCostModel")
+        self.path_library = path_library
 
     def add_obstacle(self, x: int, y: int, direction: Direction, obstacle_id: int):
         """Add obstacle to MazeSolver object
@@ -51,14 +143,149 @@ class MazeSolver:
             direction (Direction): Direction of obstacle
             obstacle_id (int): ID of obstacle
         """
+        synced = self._tables_version == self.grid.version
         # Create an obstacle object
         obstacle = Obstacle(x, y, direction, obstacle_id)
         # Add created obstacle to grid object
         self.grid.add_obstacle(obstacle)
+        # Paths away from the new obstacle are still valid, and still the shortest since obstacles only add costs
+        self._invalidate_paths(self.get_obstacle_zone(obstacle), synced)
+
+    def remove_obstacle(self, obstacle_id: int):
+        """Remove obstacle from MazeSolver object
+
+        Cached paths that do not pass near the obstacle are kept. They stay collision-free, but may no longer be
+        the shortest, since removing the obstacle can open up shorter paths.
+
+        Args:
+            obstacle_id (int): ID of obstacle
+
+        Returns:
+            Obstacle: the removed obstacle, None if there is no obstacle with that id
+        """
+        synced = self._tables_version == self.grid.version
+        obstacle = self.grid.remove_obstacle(obstacle_id)
+        if obstacle is not None:
+            self._invalidate_paths(self.get_obstacle_zone(obstacle), synced)
+        return obstacle
+
+    def update_obstacle(self, obstacle_id: int, x: int, y: int, direction: Direction):
+        """Move or re-face an obstacle of the MazeSolver object, keeping the cached paths it does not affect
+
+        Re-facing an obstacle (e.g. when image recognition reports a wrong face) does not change which cells are
+        reachable, so every cached path is kept. Moving it has the same caveat as `remove_obstacle`.
+
+        Args:
+            obstacle_id (int): ID of obstacle
+            x (int): new x coordinate of obstacle
+            y (int): new y coordinate of obstacle
+            direction (Direction): new Direction of obstacle
+        """
+        synced = self._tables_version == self.grid.version
+        obstacle = Obstacle(x, y, direction, obstacle_id)
+        old_obstacle = self.grid.update_obstacle(obstacle)
+
+        zone = self.get_obstacle_zone(obstacle)
+        if old_obstacle is not None:
+            if old_obstacle.x == x and old_obstacle.y == y:
+                # Only the face changed, the clearance of every cell stays the same and so does the successor table
+                zone = set()
+                if self._successor_table_version == self.grid.version - 1:
+                    self._successor_table_version = self.grid.version
+            else:
+                zone |= self.get_obstacle_zone(old_obstacle)
+        self._invalidate_paths(zone, synced)
 
     def reset_obstacles(self):
         self.grid.reset_obstacles()
 
+    def get_obstacle_zone(self, obstacle: Obstacle) -> Set[Tuple[int, int]]:
+        """Returns the cells whose moves can depend on the given obstacle, see `Grid.get_clearance_zone`
+
+        With the swept footprint, the turns starting further away from the obstacle can also hit it, see `algo.footprint`.
+
+        Args:
+            obstacle (Obstacle): obstacle, which does not need to be in the grid
+
+        Returns:
+            Set[Tuple[int, int]]: (x, y) of the cells within the grid
+        """
+        zone = self.grid.get_clearance_zone(obstacle)
+        if self.swept_footprint:
+            # Bounds of the sweeps of every move, relative to the start of the move
+            low_x = low_y = high_x = high_y = 0
+            for sweep in self._get_move_sweeps().values():
+                low_x, low_y = min(low_x, sweep.min_dx), min(low_y, sweep.min_dy)
+                high_x = max(high_x, sweep.min_dx + len(sweep.masks) - 1)
+                high_y = max(high_y, sweep.min_dy + max(mask.bit_length() for mask in sweep.masks) - 1)
+            for x in range(max(obstacle.x - high_x, 0), min(obstacle.x + self.scale - low_x, self.grid.size_x)):
+                for y in range(max(obstacle.y - high_y, 0), min(obstacle.y + self.scale - low_y, self.grid.size_y)):
+                    zone.add((x, y))
+        return zone
+
+    def _get_move_sweeps(self):
+        """Returns the sweeps of every move of the turning mode by (direction, new direction, dx, dy)"""
+        sweeps = dict()
+        for direction, dx, dy in ((Direction(d), dx, dy) for dx, dy, d in MOVE_DIRECTION):
+            for step in (1, -1):
+                sweeps[(direction, direction, dx * step, dy * step)] = get_straight_sweep(direction, step, self.scale)
+        bigger_change, smaller_change = (change * self.scale for change in turn_wrt_big_turns[self.big_turn])
+        for (direction, new_direction), displacements in TURN_DISPLACEMENTS.items():
+            for (x_big, x_small), (y_big, y_small) in displacements:
+                dx = x_big * bigger_change + x_small * smaller_change
+                dy = y_big * bigger_change + y_small * smaller_change
+                sweeps[(direction, new_direction, dx, dy)] = get_turn_sweep(
+                    direction, new_direction, dx, dy, self.scale
+                )
+        return sweeps
+
+    def _invalidate_paths(self, zone: Set[Tuple[int, int]], synced: bool):
+        """Drop the cached paths passing through the zone after the obstacles have changed
+
+        Args:
+            zone (Set[Tuple[int, int]]): (x, y) of the cells whose clearance may have changed
+            synced (bool): whether the tables were up to date before the change, otherwise they are all dropped
+        """
+        if not synced:
+            self.path_table.clear()
+            self.cost_table.clear()
+        else:
+            for key, path in list(self.path_table.items()):
+                if any((x, y) in zone for x, y, _ in path):
+                    del self.path_table[key]
+                    self.cost_table.pop(key, None)
+
+        self._tables_version = self.grid.version
+
+    def replan_from(self, state: CellState, retrying=False, visited_ids=()):
+        """Plan the rest of the run from the robot's current pose, reusing every cached path that is still valid
+
+        Args:
+            state (CellState): current pose of the robot
+            retrying (bool, optional): whether the robot is retrying to view the obstacles from further away
+            visited_ids (Iterable[int], optional): IDs of the obstacles that do not need to be viewed anymore
+
+        Returns:
+            Tuple[List[CellState], float]: the optimal path from the current pose and its distance
+        """
+        self.robot = Robot(state.x, state.y, state.direction)
+
+        items, item_indices = self.get_view_items(retrying)
+        obstacle_ids = [ob.obstacle_id for ob in self.grid.obstacles if ob.direction != Direction.SKIP]
+        visited_ids = set(visited_ids)
+
+        # Keep the start state and the view positions of the obstacles still to be viewed
+        remaining_items = [items[0]]
+        remaining_indices = []
+        for obstacle_id, indices in zip(obstacle_ids, item_indices):
+            if obstacle_id in visited_ids:
+                continue
+            remaining_indices.append(list(range(len(remaining_items), len(remaining_items) + len(indices))))
+            remaining_items = remaining_items + [items[idx] for idx in indices]
+
+        cost_np = self.get_cost_matrix(remaining_items)
+        return self.solve_order(remaining_items, remaining_indices, cost_np)
+
     @staticmethod
     def compute_coord_distance(x1: int, y1: int, x2: int, y2: int, level=1):
         """Compute the L-n distance between two coordinates
@@ -117,114 +344,251 @@ class MazeSolver:
         s.sort(key=lambda x: x.count("1"), reverse=True)
         return s
 
-    def get_optimal_order_dp(self, retrying) -> List[CellState]:
-        distance = 1e9
-        optimal_path = []
+    def get_optimal_order_dp(self, retrying, return_stats=False) -> List[CellState]:
+        """Find the optimal path visiting the obstacles, see `solve_order`
+
+        Args:
+            retrying (bool): whether the robot is retrying to view the obstacles from further away
+            return_stats (bool, optional): whether to also return the PlannerStats of the plan
+
+        Returns:
+            Tuple[List[CellState], float]: the optimal path and its distance, followed by the PlannerStats if
+                return_stats
+        """
+        self.stats = PlannerStats() if return_stats else None
 
-        # print(f"Inside get_optimal_order_dp: retrying = {retrying}")
         # Get all possible positions that can view the obstacles
+        with self._stage("view_positions"):
+            items, item_indices = self.get_view_items(retrying)
+
+        # Generate the path cost between every pair of items once, each subset only slices it
+        with self._stage("path_costs"):
+            cost_np = self.get_cost_matrix(items)
+
+        optimal_path, distance = self.solve_order(items, item_indices, cost_np)
+        if return_stats:
+            return optimal_path, distance, self.stats
+        return optimal_path, distance
+
+    def _stage(self, name: str):
+        # Time the stage if stats are being collected, see PlannerStats
+        return nullcontext() if self.stats is None else self.stats.stage(name)
+
+    def get_view_items(self, retrying):
+        """Collect the states to plan over: the robot's start state followed by every view position of every obstacle
+
+        Args:
+            retrying (bool): whether the robot is retrying to view the obstacles from further away
+
+        Returns:
+            Tuple[List[CellState], List[List[int]]]: the states, and the indices of the view positions of each obstacle
+        """
         all_view_positions = self.grid.get_view_obstacle_positions(retrying)
-        # print(f"all_view_positions: {all_view_positions}")
-        # print(f"All view position: {all_view_positions}")
 
-        for op in self.get_visit_options(len(all_view_positions)):
-            # op is binary string of length len(all_view_positions) == len(obstacles)
-            # If index == 1 means the view_positions[index] is selected to visit, otherwise drop
+        # Initialize `items` to be a list containing the robot's start state as the first item
+        items = [self.robot.get_start_state()]
+        # Indices of the view positions of each obstacle in `items`
+        item_indices = []
+        for view_positions in all_view_positions:
+            item_indices.append(list(range(len(items), len(items) + len(view_positions))))
+            items = items + view_positions
 
-            # Calculate optimal_cost table
+        return items, item_indices
 
-            # Initialize `items` to be a list containing the robot's start state as the first item
-            items = [self.robot.get_start_state()]
-            # Initialize `cur_view_positions` to be an empty list
-            cur_view_positions = []
+    def get_optimal_order(self, retrying, time_budget_ms=None, return_stats=False):
+        """Anytime version of `get_optimal_order_dp`: find a good order quickly, and the optimal one if time allows
 
-            # print(f"===================\nop = {op}")
-            # print("List of obstacle visited: \n")
+        A nearest neighbour order is improved with local search over the path costs, then the exact tables are
+        built in the time left. Generating the path costs is always done in full, it is not bounded by the budget.
 
-            # For each obstacle
-            for idx in range(len(all_view_positions)):
-                # If robot is visiting
-                if op[idx] == "1":
-                    # Add possible cells to `items`
-                    items = items + all_view_positions[idx]
-                    # Add possible cells to `cur_view_positions`
-                    cur_view_positions.append(all_view_positions[idx])
-                    # print("obstacle: {}\n".format(self.grid.obstacles[idx]))
-
-            # Generate the path cost for the items
-            self.path_cost_generator(items)
-            combination = []
-            self.generate_combination(
-                cur_view_positions, 0, [], combination, [ITERATIONS]
-            )
+        Args:
+            retrying (bool): whether the robot is retrying to view the obstacles from further away
+            time_budget_ms (float, optional): milliseconds to plan for, None to always find the optimal order
+            return_stats (bool, optional): whether to also return the PlannerStats of the plan
+
+        Returns:
+            Tuple[List[CellState], float, bool]: the best path found, its distance, and whether it is optimal,
+                followed by the PlannerStats if return_stats
+        """
+        deadline = None if time_budget_ms is None else time.perf_counter() + time_budget_ms / 1000
+        self.stats = PlannerStats() if return_stats else None
+
+        with self._stage("view_positions"):
+            items, item_indices = self.get_view_items(retrying)
+        with self._stage("path_costs"):
+            cost_np = self.get_cost_matrix(items)
+        penalties = self.get_penalties(items)
+
+        permutation, distance = self.solve_order_heuristic(cost_np, item_indices, penalties, deadline)
+
+        with self._stage("tsp"):
+            tables = SetTSPTables(cost_np, item_indices, penalties, deadline=deadline)
+        if tables.complete:
+            optimal_path, distance = self.solve_order(items, item_indices, cost_np, tables)
+            result = (optimal_path, distance, True)
+        else:
+            result = (self.expand_path(items, permutation), distance, False)
 
-            for c in combination:  # run the algo some times ->
-                visited_candidates = [0]  # add the start state of the robot
+        if return_stats:
+            return result + (self.stats,)
+        return result
 
-                cur_index = 1
-                fixed_cost = (
-                    0  # the cost applying for the position taking obstacle pictures
-                )
-                for index, view_position in enumerate(cur_view_positions):
-                    visited_candidates.append(cur_index + c[index])
-                    fixed_cost += view_position[c[index]].penalty
-                    cur_index += len(view_position)
-
-                cost_np = np.zeros((len(visited_candidates), len(visited_candidates)))
-
-                for s in range(len(visited_candidates) - 1):
-                    for e in range(s + 1, len(visited_candidates)):
-                        u = items[visited_candidates[s]]
-                        v = items[visited_candidates[e]]
-                        if (u, v) in self.cost_table.keys():
-                            cost_np[s][e] = self.cost_table[(u, v)]
-                        else:
-                            cost_np[s][e] = 1e9
-                        cost_np[e][s] = cost_np[s][e]
-                cost_np[:, 0] = 0
-                _permutation, _distance = solve_tsp_dynamic_programming(cost_np)
-                # print(f"fixed_cost = {fixed_cost}")
-                # print(f"distance = {_distance}")
-                if _distance + fixed_cost >= distance:
-                    continue
+    def solve_order_heuristic(self, cost_np, item_indices, penalties, deadline=None):
+        """Find a good order to visit the obstacles with local search, see `solve_set_tsp_local_search`
 
-                optimal_path = [items[0]]
-                distance = _distance + fixed_cost
+        Like `solve_order`, obstacles are only dropped if they cannot all be visited, but the obstacles dropped are
+        picked greedily rather than optimally.
 
-                for i in range(len(_permutation) - 1):
-                    from_item = items[visited_candidates[_permutation[i]]]
-                    to_item = items[visited_candidates[_permutation[i + 1]]]
+        Args:
+            cost_np (List[List[float]]): path costs between the items from `get_cost_matrix`
+            item_indices (List[List[int]]): indices of the view positions of each obstacle from `get_view_items`
+            penalties (List[float]): cost of taking a picture from each item, see `get_penalties`
+            deadline (float, optional): value of `time.perf_counter()` at which to stop improving the order
 
-                    cur_path = self.path_table[(from_item, to_item)]
-                    for j in range(1, len(cur_path)):
-                        optimal_path.append(
-                            CellState(cur_path[j][0], cur_path[j][1], cur_path[j][2])
-                        )
+        Returns:
+            Tuple[List[int], float]: the indices of the items in visiting order and the distance
+        """
+        # Obstacles without any view position cannot be visited at all
+        groups = [group for group in item_indices if group]
+        while True:
+            with self._stage("tsp"):
+                permutation, distance = solve_set_tsp_local_search(cost_np, groups, penalties, deadline)
+            if self.stats is not None:
+                self.stats.tsp_solves += 1
+            # Paths that do not exist cost 1e9, drop the obstacle that could not be reached and try again
+            unreachable = [b for a, b in zip(permutation, permutation[1:]) if cost_np[a][b] >= 1e9]
+            if not unreachable:
+                return permutation, distance
+            groups = [group for group in groups if unreachable[0] not in group]
+
+    def get_penalties(self, items):
+        """The cost applying for the position taking obstacle pictures, for each item, in the units of the cost model"""
+        penalties = [
+            float(self.cost_model.penalty_cost(item.penalty, self.scale) + self.cost_model.snap_cost) for item in items
+        ]
+        penalties[0] = 0.0
+        return penalties
+
+    def solve_order(self, items, item_indices, cost_np, tables=None):
+        """Find the cheapest path visiting the obstacles, see `find_order`
+
+        Returns:
+            Tuple[List[CellState], float]: the optimal path and its distance
+        """
+        permutation, distance = self.find_order(items, item_indices, cost_np, tables)
+        return self.expand_path(items, permutation), distance
+
+    def find_order(self, items, item_indices, cost_np, tables=None):
+        """Find the cheapest order to visit the obstacles, dropping obstacles only if they cannot all be visited
+
+        Args:
+            items (List[CellState]): states from `get_view_items`
+            item_indices (List[List[int]]): indices of the view positions of each obstacle from `get_view_items`
+            cost_np (List[List[float]]): path costs between the items from `get_cost_matrix`
+            tables (SetTSPTables, optional): tables already built for these items
+
+        Returns:
+            Tuple[List[int], float]: the indices of the items in visiting order and the distance
+        """
+        distance = 1e9
+        permutation = None
+
+        # Nodes of the set TSP are the items, and the view positions of each obstacle form a group of which exactly
+        # one is visited. The tables hold the optimal path for every subset of obstacles at once
+        if tables is None:
+            with self._stage("tsp"):
+                tables = SetTSPTables(cost_np, item_indices, self.get_penalties(items))
+
+        with self._stage("combinations"):
+            visit_options = self.get_visit_options(len(item_indices))
+
+        for op in visit_options:
+            # op is binary string of length len(item_indices) == len(obstacles)
+            # If index == 1 means the view_positions[index] is selected to visit, otherwise drop
+            mask = 0
+            for idx in range(len(item_indices)):
+                # If robot is visiting
+                if op[idx] == "1":
+                    mask |= 1 << idx
+
+            with self._stage("tsp"):
+                _permutation, _distance = tables.solve(mask)
+            if self.stats is not None:
+                self.stats.subsets_tried += 1
+                self.stats.tsp_solves += 1
 
-                    optimal_path[-1].set_screenshot(to_item.screenshot_id)
+            if _distance < distance:
+                permutation = _permutation
+                distance = _distance
 
-            if optimal_path:
+            if permutation is not None:
                 # if found optimal path, return
                 break
 
-        return optimal_path, distance
+        return permutation, distance
 
-    @staticmethod
-    def generate_combination(view_positions, index, current, result, iteration_left):
-        if index == len(view_positions):
-            result.append(current[:])
-            return
-
-        if iteration_left[0] == 0:
-            return
-
-        iteration_left[0] -= 1
-        for j in range(len(view_positions[index])):
-            current.append(j)
-            MazeSolver.generate_combination(
-                view_positions, index + 1, current, result, iteration_left
-            )
-            current.pop()
+    def expand_path(self, items, permutation):
+        """Join the cached paths between the items in the order of the permutation
+
+        Args:
+            items (List[CellState]): states from `get_view_items`
+            permutation (List[int]): indices of the items in visiting order, starting with 0
+
+        Returns:
+            List[CellState]: every state of the path, with the screenshot ids set at the view positions
+        """
+        if permutation is None:
+            return []
+
+        optimal_path = [items[0]]
+        for leg in self.iter_legs(items, permutation):
+            optimal_path.extend(leg[1:])
+
+        return optimal_path
+
+    def iter_legs(self, items, permutation):
+        """Expand the path between each pair of consecutive items of the permutation, one leg at a time
+
+        Args:
+            items (List[CellState]): states from `get_view_items`
+            permutation (List[int]): indices of the items in visiting order, starting with 0
+
+        Yields:
+            List[CellState]: the states of one leg, starting with the last state of the previous leg and ending at a
+                view position, with its screenshot id set
+        """
+        leg_start = items[0]
+        for i in range(len(permutation) - 1):
+            from_item = items[permutation[i]]
+            to_item = items[permutation[i + 1]]
+
+            leg = [leg_start]
+            cur_path = self.path_table[(from_item, to_item)]
+            for j in range(1, len(cur_path)):
+                leg.append(CellState(cur_path[j][0], cur_path[j][1], cur_path[j][2]))
+
+            leg[-1].set_screenshot(to_item.screenshot_id)
+            leg_start = leg[-1]
+            yield leg
+
+    def get_cost_matrix(self, states: List[CellState]) -> List[List[float]]:
+        """Generate the path cost between every pair of the input states, see `path_cost_generator`
+
+        Args:
+            states (List[CellState]): cell states to visit
+
+        Returns:
+            List[List[float]]: symmetric matrix of the path costs between the states, 1e9 if there is no path
+        """
+        self.path_cost_generator(states)
+
+        cost_np = [[0.0] * len(states) for _ in states]
+        for s in range(len(states) - 1):
+            for e in range(s + 1, len(states)):
+                cost_np[s][e] = float(self.cost_table.get((states[s], states[e]), 1e9))
+                cost_np[e][s] = cost_np[s][e]
+
+        return cost_np
 
     def get_safe_cost(self, x, y):
         """Get the safe cost of a particular x,y coordinate wrt obstacles that are exactly 2 units away from it in both x and y directions
@@ -236,17 +600,7 @@ class MazeSolver:
         Returns:
             int: safe cost
         """
-        for ob in self.grid.obstacles:
-            if abs(ob.x - x) == 2 and abs(ob.y - y) == 2:
-                return SAFE_COST
-
-            if abs(ob.x - x) == 1 and abs(ob.y - y) == 2:
-                return SAFE_COST
-
-            if abs(ob.x - x) == 2 and abs(ob.y - y) == 1:
-                return SAFE_COST
-
-        return 0
+        return self.grid.get_safe_cost(x, y)
 
     def get_neighbors(
         self, x, y, direction
@@ -264,6 +618,9 @@ class MazeSolver:
         # If it is exactly 2 units away in both x and y directions, safe cost = SAFECOST. Else, safe cost = 0
 
         neighbors = []
+        # Turning displacement is either 4-2 or 3-1, in cells of CELL_SIZE
+        bigger_change, smaller_change = (change * self.scale for change in turn_wrt_big_turns[self.big_turn])
+
         # Assume that after following this direction, the car direction is EXACTLY md
         for dx, dy, md in MOVE_DIRECTION:
             if md == direction:  # if the new direction == md
@@ -278,220 +635,168 @@ class MazeSolver:
                     safe_cost = self.get_safe_cost(x - dx, y - dy)
                     neighbors.append((x - dx, y - dy, md, safe_cost))
 
-            else:  # consider 8 cases
-
-                # Turning displacement is either 4-2 or 3-1
-                bigger_change = turn_wrt_big_turns[self.big_turn][0]
-                smaller_change = turn_wrt_big_turns[self.big_turn][1]
-
-                # north <-> east
-                if direction == Direction.NORTH and md == Direction.EAST:
-
-                    # Check for valid position
-                    if self.grid.reachable(
-                        x + bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        # Get safe cost of destination
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
+            else:  # consider the forward and backward turn into md, if any
+                for (x_big, x_small), (y_big, y_small) in TURN_DISPLACEMENTS.get(
+                    (direction, md), []
+                ):
+                    new_x = x + x_big * bigger_change + x_small * smaller_change
+                    new_y = y + y_big * bigger_change + y_small * smaller_change
 
                     # Check for valid position
                     if self.grid.reachable(
-                        x - smaller_change, y - bigger_change, turn=True
+                        new_x, new_y, turn=True
                     ) and self.grid.reachable(x, y, preTurn=True):
                         # Get safe cost of destination
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
-
-                if direction == Direction.EAST and md == Direction.NORTH:
-                    if self.grid.reachable(
-                        x + smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
-
-                    if self.grid.reachable(
-                        x - bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
-
-                # east <-> south
-                if direction == Direction.EAST and md == Direction.SOUTH:
-
-                    if self.grid.reachable(
-                        x + smaller_change, y - bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
-
-                    if self.grid.reachable(
-                        x - bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
-
-                if direction == Direction.SOUTH and md == Direction.EAST:
-                    if self.grid.reachable(
-                        x + bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
+                        safe_cost = self.get_safe_cost(new_x, new_y)
+                        # The turn penalty is a distance, so it is scaled like the turn
+                        neighbors.append((new_x, new_y, md, safe_cost + 10 * self.scale))
 
-                    if self.grid.reachable(
-                        x - smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
+        return neighbors
 
-                # south <-> west
-                if direction == Direction.SOUTH and md == Direction.WEST:
-                    if self.grid.reachable(
-                        x - bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
+    def get_successor_table(self) -> SuccessorTable:
+        """Returns the successor table of the current grid and turning mode, building it if the grid has changed
 
-                    if self.grid.reachable(
-                        x + smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
+        Returns:
+            SuccessorTable: successors of every state of the grid
+        """
+        if (
+            self._successor_table is None
+            or self._successor_table_version != self.grid.version
+        ):
+            # Obstacles only remove moves or add safe costs, so the moves of the obstacle-free grid are filtered by
+            # the clearance of the grid instead of generating the neighbours of every state again
+            plain, turn, pre_turn = self.grid.get_clearance_layers()
+            safe_costs = self.grid.get_safe_costs()
+            # Safe costs are in steps, see StepCostModel
+            penalty_factor = self.cost_model.penalty_factor
+            offsets = [0]
+            targets = []
+            costs = []
+            # With the swept footprint, the moves starting near an obstacle are also swept over the obstacles
+            swept_zone = set()
+            if self.swept_footprint:
+                raster = occupancy_raster(
+                    [(ob.x, ob.y) for ob in self.grid.obstacles], self.grid.size_x, self.grid.size_y, self.scale
+                )
+                sweeps = self._get_move_sweeps()
+                for ob in self.grid.obstacles:
+                    swept_zone |= self.get_obstacle_zone(ob)
+            for sid, (x, y, moves) in enumerate(self._get_free_moves()):
+                can_turn = pre_turn[x][y]
+                swept = (x, y) in swept_zone
+                for target, cost, next_x, next_y, is_turn in moves:
+                    if (turn[next_x][next_y] and can_turn) if is_turn else plain[next_x][next_y]:
+                        if swept and sweeps[
+                            (STATE_DIRECTIONS[sid % 4], STATE_DIRECTIONS[target % 4], next_x - x, next_y - y)
+                        ].hits(raster, x, y):
+                            continue
+                        targets.append(target)
+                        costs.append(cost + safe_costs[next_x][next_y] * penalty_factor)
+                offsets.append(len(targets))
+
+            self._successor_table = SuccessorTable.from_edges(
+                self.grid.size_x, self.grid.size_y, offsets, targets, costs
+            )
+            self._successor_table_version = self.grid.version
 
-                if direction == Direction.WEST and md == Direction.SOUTH:
-                    if self.grid.reachable(
-                        x - smaller_change, y - bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
+        return self._successor_table
 
-                    if self.grid.reachable(
-                        x + bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
+    def _get_free_moves(self):
+        """Returns the moves of every state of the obstacle-free grid of the same size, cell size and turning mode
 
-                # west <-> north
-                if direction == Direction.WEST and md == Direction.NORTH:
-                    if self.grid.reachable(
-                        x - smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
+        Returns:
+            List[Tuple[int, int, List[Tuple]]]: x and y of every state in state id order, with its moves as
+                (target state id, cost of the move from the cost model, target x, target y, whether it is a turn)
+        """
+        key = (self.grid.size_x, self.grid.size_y, self.scale, self.big_turn, self.cost_model.key)
+        if key not in _free_moves:
+            free_solver = MazeSolver(
+                self.grid.size_x, self.grid.size_y, 1, 1, Direction.NORTH, big_turn=self.big_turn, cell_size=self.cell_size
+            )
+            free_table = SuccessorTable(self.grid.size_x, self.grid.size_y, free_solver.get_neighbors)
+            moves = []
+            for sid, (x, y, direction) in enumerate(free_table.states):
+                state_moves = []
+                for k in range(free_table.offsets[sid], free_table.offsets[sid + 1]):
+                    next_x, next_y, next_direction = free_table.states[free_table.targets[k]]
+                    move_cost = self.cost_model.move_cost(direction, next_direction, self.scale)
+                    state_moves.append(
+                        (free_table.targets[k], move_cost, next_x, next_y, next_direction != direction)
+                    )
+                moves.append((x, y, state_moves))
+            _free_moves[key] = moves
 
-                    if self.grid.reachable(
-                        x + bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
+        return _free_moves[key]
 
-                if direction == Direction.NORTH and md == Direction.WEST:
-                    if self.grid.reachable(
-                        x + smaller_change, y - bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
+    def get_heuristic_table(self) -> HeuristicTable:
+        """Returns the A* heuristic table of the grid size, cell size and turning mode, building it on first use
 
-                    if self.grid.reachable(
-                        x - bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
+        Returns:
+            HeuristicTable: lower bounds of the path costs between any two states
+        """
+        key = (self.grid.size_x, self.grid.size_y, self.scale, self.big_turn, self.cost_model.key)
+        if key not in _heuristic_tables:
+            # Obstacle-free grid large enough to hold every path of this grid, see HeuristicTable
+            free_solver = MazeSolver(
+                2 * self.grid.size_x - 1,
+                2 * self.grid.size_y - 1,
+                1,
+                1,
+                Direction.NORTH,
+                big_turn=self.big_turn,
+                cell_size=self.cell_size,
+                cost_model=self.cost_model,
+            )
+            _heuristic_tables[key] = HeuristicTable(
+                self.grid.size_x, self.grid.size_y, free_solver.get_successor_table()
+            )
 
-        return neighbors
+        return _heuristic_tables[key]
 
-    def path_cost_generator(self, states: List[CellState]):
+    def path_cost_generator(self, states: List[CellState], method="dijkstra"):
         """Generate the path cost between the input states and update the tables accordingly
 
         Args:
             states (List[CellState]): cell states to visit
+            method (str, optional): "dijkstra" to run one search per source that settles all of its targets at once,
+                "astar" to run one A* search per pair of states, guided by the heuristic table, or "bidirectional" to
+                run the A* search of each pair from both of its ends. All produce the same costs, but may pick
+                different paths among the ones of equal cost. Defaults to "dijkstra".
         """
 
-        def record_path(start, end, parent: dict, cost: int):
+        # The tables are only valid for the obstacles they were computed with
+        if self._tables_version != self.grid.version:
+            self.path_table.clear()
+            self.cost_table.clear()
+            self._tables_version = self.grid.version
+
+        def record_path(start, end, path: list, cost: int):
 
             # Update cost table for the (start,end) and (end,start) edges
             self.cost_table[(start, end)] = cost
             self.cost_table[(end, start)] = cost
 
-            path = []
-            cursor = (end.x, end.y, end.direction)
-
-            while cursor in parent:
-                path.append(cursor)
-                cursor = parent[cursor]
-
-            path.append(cursor)
-
-            # Update path table for the (start,end) and (end,start) edges, with the (start,end) edge being the reversed path
-            self.path_table[(start, end)] = path[::-1]
-            self.path_table[(end, start)] = path
+            # Update path table for the (start,end) and (end,start) edges, with the (end,start) edge being the reversed path
+            self.path_table[(start, end)] = path
+            self.path_table[(end, start)] = path[::-1]
+
+        def count_search(expanded: int, pushed: int):
+            # Add the counters of one search to the stats, if they are collected
+            if self.stats is not None:
+                self.stats.path_searches += 1
+                self.stats.nodes_expanded += expanded
+                self.stats.nodes_pushed += pushed
+
+        def walk_parents(parent, cur_id: int, root_id: int):
+            # States from cur_id to the root of the search, following the parents
+            path = [table_states[cur_id]]
+            while cur_id != root_id:
+                cur_id = parent[cur_id]
+                path.append(table_states[cur_id])
+            return path
 
         def astar_search(start: CellState, end: CellState):
-            # astar search algo with three states: x, y, direction
+            # astar search algo over state ids, see SuccessorTable.state_id
 
             # If it is already done before, return
             if (start, end) in self.path_table:
@@ -499,80 +804,279 @@ class MazeSolver:
 
             # Heuristic to guide the search: 'distance' is calculated by f = g + h
             # g is the actual distance moved so far from the start node to current node
-            # h is the heuristic distance from current node to end node
-            g_distance = {(start.x, start.y, start.direction): 0}
-
-            # format of each item in heap: (f_distance of node, x coord of node, y coord of node)
-            # heap in Python is a min-heap
-            heap = [
-                (
-                    self.compute_state_distance(start, end),
-                    start.x,
-                    start.y,
-                    start.direction,
-                )
-            ]
-            parent = dict()
-            visited = set()
+            # h is the heuristic distance from current node to end node, a lower bound that accounts for turning
+            h_distance = heuristic_table.bounds_to(end.x, end.y, end.direction)
+            start_id = table.state_id(start.x, start.y, start.direction)
+            end_id = table.state_id(end.x, end.y, end.direction)
+
+            generation = buffers.new_search()
+            g_distance[start_id] = 0
+            reached[start_id] = generation
+
+            # format of each item in heap: (f_distance of node, state id of node)
+            # heap in Python is a min-heap, and ties are broken by state id, i.e. by x, y and direction
+            heap = [(h_distance[start_id], start_id)]
+            expanded, pushed = 0, 1
 
             while heap:
                 # Pop the node with the smallest distance
-                _, cur_x, cur_y, cur_direction = heapq.heappop(heap)
+                _, cur_id = heappop(heap)
 
-                if (cur_x, cur_y, cur_direction) in visited:
+                if settled[cur_id] == generation:
                     continue
 
-                if end.is_eq(cur_x, cur_y, cur_direction):
-                    record_path(
-                        start, end, parent, g_distance[(cur_x, cur_y, cur_direction)]
-                    )
-                    return
+                if cur_id == end_id:
+                    record_path(start, end, walk_parents(parent, end_id, start_id)[::-1], g_distance[cur_id])
+                    break
 
-                visited.add((cur_x, cur_y, cur_direction))
-                cur_distance = g_distance[(cur_x, cur_y, cur_direction)]
+                settled[cur_id] = generation
+                expanded += 1
+                cur_distance = g_distance[cur_id]
 
-                for next_x, next_y, new_direction, safe_cost in self.get_neighbors(
-                    cur_x, cur_y, cur_direction
-                ):
-                    if (next_x, next_y, new_direction) in visited:
+                for k in range(offsets[cur_id], offsets[cur_id + 1]):
+                    next_id = targets[k]
+                    if settled[next_id] == generation:
                         continue
 
-                    move_cost = (
-                        Direction.rotation_cost(new_direction, cur_direction)
-                        * TURN_FACTOR
-                        + 1
-                        + safe_cost
-                    )
+                    # Turning, moving and safe costs are precomputed in the successor table
+                    next_distance = cur_distance + move_costs[k]
 
-                    # the cost to check if any obstacles that considered too near the robot; if it
-                    # safe_cost =
+                    if reached[next_id] != generation or g_distance[next_id] > next_distance:
+                        g_distance[next_id] = next_distance
+                        reached[next_id] = generation
+                        parent[next_id] = cur_id
 
-                    # new cost is calculated by the cost to reach current state + cost to move from
-                    # current state to new state + heuristic cost from new state to end state
-                    next_cost = (
-                        cur_distance
-                        + move_cost
-                        + self.compute_coord_distance(next_x, next_y, end.x, end.y)
-                    )
+                        # new cost is calculated by the cost to reach new state + heuristic cost from new state to end state
+                        heappush(heap, (next_distance + h_distance[next_id], next_id))
+                        pushed += 1
 
-                    if (next_x, next_y, new_direction) not in g_distance or g_distance[
-                        (next_x, next_y, new_direction)
-                    ] > cur_distance + move_cost:
-                        g_distance[(next_x, next_y, new_direction)] = (
-                            cur_distance + move_cost
-                        )
-                        parent[(next_x, next_y, new_direction)] = (
-                            cur_x,
-                            cur_y,
-                            cur_direction,
-                        )
+            count_search(expanded, pushed)
+
+        def bidirectional_search(start: CellState, end: CellState):
+            # astar search from both ends at once, meeting in the middle
+
+            # If it is already done before, return
+            if (start, end) in self.path_table:
+                return
+
+            start_id = table.state_id(start.x, start.y, start.direction)
+            end_id = table.state_id(end.x, end.y, end.direction)
+            if start_id == end_id:
+                record_path(start, end, [table_states[start_id]], 0)
+                return
+
+            # Both searches use the average of the two heuristics so that they agree on which node is closer,
+            # doubled to stay integers: the forward key of a node is 2 * g + potential, the backward one 2 * g - potential
+            to_end = heuristic_table.bounds_to(end.x, end.y, end.direction)
+            from_start = heuristic_table.bounds_from(start.x, start.y, start.direction)
+
+            # For each direction: g distances, parents (next node towards the end for the backward search),
+            # heaps of (key, state id) and settled states
+            g_distance = ({start_id: 0}, {end_id: 0})
+            parent = (dict(), dict())
+            heaps = (
+                [(to_end[start_id] - from_start[start_id], start_id)],
+                [(from_start[end_id] - to_end[end_id], end_id)],
+            )
+            visited = (set(), set())
+            edges = ((offsets, targets, move_costs), (table.reverse_offsets, table.sources, table.reverse_costs))
+            sign = (1, -1)
+
+            # Cost of the best path found so far and the state where its two halves meet
+            best, meet = math.inf, None
+            expanded, pushed = 0, 2
+
+            while heaps[0] and heaps[1]:
+                # Stop once no path through an unsettled state can be shorter than the best one
+                if heaps[0][0][0] + heaps[1][0][0] >= 2 * best:
+                    break
+
+                # Expand the side with fewer states waiting
+                side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+                _, cur_id = heappop(heaps[side])
+                if cur_id in visited[side]:
+                    continue
+                visited[side].add(cur_id)
+                expanded += 1
+
+                cur_distance = g_distance[side][cur_id]
+                edge_offsets, edge_states, edge_costs = edges[side]
+                for k in range(edge_offsets[cur_id], edge_offsets[cur_id + 1]):
+                    next_id = edge_states[k]
+                    if next_id in visited[side]:
+                        continue
+
+                    next_distance = cur_distance + edge_costs[k]
+                    if next_id not in g_distance[side] or g_distance[side][next_id] > next_distance:
+                        g_distance[side][next_id] = next_distance
+                        parent[side][next_id] = cur_id
+                        potential = sign[side] * (to_end[next_id] - from_start[next_id])
+                        heappush(heaps[side], (2 * next_distance + potential, next_id))
+                        pushed += 1
+
+                        # A path joining the two searches
+                        if next_id in g_distance[1 - side] and next_distance + g_distance[1 - side][next_id] < best:
+                            best = next_distance + g_distance[1 - side][next_id]
+                            meet = next_id
+
+            count_search(expanded, pushed)
+            if meet is None:
+                return
+
+            # Both halves of the path start at the state where they meet
+            path = walk_parents(parent[0], meet, start_id)[::-1] + walk_parents(parent[1], meet, end_id)[1:]
+            record_path(start, end, path, best)
+
+        def dijkstra_search(source: CellState, others: List[CellState], backward=False):
+            # dijkstra search from source, stopping once every other state is settled. If backward, the search runs
+            # over the reversed edges and finds the paths from the other states to the source instead
+
+            # Group the other states that are not done before by their state id
+            remaining = dict()
+            for other in others:
+                if ((other, source) if backward else (source, other)) not in self.path_table:
+                    remaining.setdefault(table.state_id(other.x, other.y, other.direction), []).append(other)
+
+            if not remaining:
+                return
+
+            if backward:
+                # The reverse edges are built on first use, see SuccessorTable
+                edge_offsets, edge_states, edge_costs = table.reverse_offsets, table.sources, table.reverse_costs
+            else:
+                edge_offsets, edge_states, edge_costs = offsets, targets, move_costs
 
-                        heapq.heappush(heap, (next_cost, next_x, next_y, new_direction))
+            source_id = table.state_id(source.x, source.y, source.direction)
+            generation = buffers.new_search()
+            g_distance[source_id] = 0
+            reached[source_id] = generation
 
-        # Nested loop through all the state pairings
-        for i in range(len(states) - 1):
-            for j in range(i + 1, len(states)):
-                astar_search(states[i], states[j])
+            # format of each item in heap: (g_distance of node, state id of node)
+            heap = [(0, source_id)]
+            # For a backward search, the parent of a node is the next node on its path to the source
+            expanded, pushed = 0, 1
+
+            while heap and remaining:
+                # Pop the node with the smallest distance
+                cur_distance, cur_id = heappop(heap)
+
+                if settled[cur_id] == generation:
+                    continue
+
+                settled[cur_id] = generation
+                expanded += 1
+
+                # The distance of a popped node is final, so record every other state at this node
+                if cur_id in remaining:
+                    path = walk_parents(parent, cur_id, source_id)
+                    for other in remaining.pop(cur_id):
+                        if backward:
+                            record_path(other, source, path, cur_distance)
+                        else:
+                            record_path(source, other, path[::-1], cur_distance)
+
+                for k in range(edge_offsets[cur_id], edge_offsets[cur_id + 1]):
+                    next_id = edge_states[k]
+                    if settled[next_id] == generation:
+                        continue
+
+                    next_distance = cur_distance + edge_costs[k]
+                    if reached[next_id] != generation or g_distance[next_id] > next_distance:
+                        g_distance[next_id] = next_distance
+                        reached[next_id] = generation
+                        parent[next_id] = cur_id
+
+                        heappush(heap, (next_distance, next_id))
+                        pushed += 1
+
+            count_search(expanded, pushed)
+
+        # Successors of every state of the grid, so that the searches only walk slices of flat arrays
+        table = self.get_successor_table()
+        offsets = table.offsets
+        targets = table.targets
+        move_costs = table.costs
+        table_states = table.states
+        if method in ("astar", "bidirectional"):
+            heuristic_table = self.get_heuristic_table()
+
+        if self.stats is not None:
+            self.stats.path_cache_hits += sum(
+                (states[i], states[j]) in self.path_table
+                for i in range(len(states) - 1)
+                for j in range(i + 1, len(states))
+            )
+
+        # Paths of the library that no obstacle gets in the way of are still optimal, so they need no search
+        if self.path_library is not None:
+            for i in range(len(states) - 1):
+                start_id = table.state_id(states[i].x, states[i].y, states[i].direction)
+                for j in range(i + 1, len(states)):
+                    if (states[i], states[j]) in self.path_table:
+                        continue
+
+                    end_id = table.state_id(states[j].x, states[j].y, states[j].direction)
+                    path = self.path_library.get_path(start_id, end_id, table)
+                    if path is not None:
+                        record_path(
+                            states[i],
+                            states[j],
+                            [table_states[sid] for sid in path],
+                            self.path_library.cost(start_id, end_id),
+                        )
+                        if self.stats is not None:
+                            self.stats.path_library_hits += 1
+
+        # Scratch arrays of the searches, allocated once and shared by every search below
+        buffers = SearchBuffers(len(table))
+        g_distance = buffers.distance
+        parent = buffers.parent
+        reached = buffers.reached
+        settled = buffers.settled
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        if method == "dijkstra":
+            # Pairs (i, j) with i < j that have no path yet. The path of a pair always goes from states[i] to
+            # states[j], as the costs are not symmetric
+            later = [set() for _ in states]
+            earlier = [set() for _ in states]
+            for i in range(len(states) - 1):
+                for j in range(i + 1, len(states)):
+                    if (states[i], states[j]) not in self.path_table:
+                        later[i].add(j)
+                        earlier[j].add(i)
+
+            # Each search completes the missing pairs of one state, either forwards towards all the later states or
+            # backwards from all the earlier states. The search completing the most pairs goes first, so that adding
+            # a few states to cached tables only searches from the new states
+            while True:
+                i = max(range(len(states)), key=lambda k: len(later[k]), default=None)
+                j = max(range(len(states)), key=lambda k: len(earlier[k]), default=None)
+                if i is None or (not later[i] and not earlier[j]):
+                    break
+
+                if len(later[i]) >= len(earlier[j]):
+                    dijkstra_search(states[i], [states[k] for k in sorted(later[i])])
+                    for k in later[i]:
+                        earlier[k].discard(i)
+                    later[i].clear()
+                else:
+                    dijkstra_search(states[j], [states[k] for k in sorted(earlier[j])], backward=True)
+                    for k in earlier[j]:
+                        later[k].discard(j)
+                    earlier[j].clear()
+        elif method == "astar":
+            # Nested loop through all the state pairings
+            for i in range(len(states) - 1):
+                for j in range(i + 1, len(states)):
+                    astar_search(states[i], states[j])
+        elif method == "bidirectional":
+            for i in range(len(states) - 1):
+                for j in range(i + 1, len(states)):
+                    bidirectional_search(states[i], states[j])
+        else:
+            raise ValueError(f"Unknown path cost method: {method}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Iterator, Optional, Tuple
+from algo.algo import MazeSolver, get_scale, warm_up
+from helper import command_generator
+from consts import CELL_SIZE, Direction, WIDTH, HEIGHT
+
+
+def make_solver(arena, **options) -> MazeSolver:
+    """Create a MazeSolver for the arena
+
+    Args:
+        arena (dict): {"robot": {x, y, d}, "obstacles": [{x, y, id, d}], "big_turn" (optional), "retrying" (optional),
+            "cell_size" (optional, in cm, which the coordinates are in cells of)}
+        **options: other arguments of MazeSolver, such as cost_model or swept_footprint
+
+    Returns:
+        MazeSolver: solver with the robot and every obstacle of the arena
+    """
+    robot = arena["robot"]
+    cell_size = arena.get("cell_size", CELL_SIZE)
+    scale = get_scale(cell_size)
+    maze_solver = MazeSolver(
+        WIDTH * scale,
+        HEIGHT * scale,
+        robot["x"],
+        robot["y"],
+        Direction(robot["d"]),
+        big_turn=arena.get("big_turn"),
+        cell_size=cell_size,
+        **options,
+    )
+    for ob in arena["obstacles"]:
+        maze_solver.add_obstacle(ob["x"], ob["y"], Direction(ob["d"]), ob["id"])
+    return maze_solver
+
+
+def plan_arena(arena) -> dict:
+    """Plan one arena from scratch, see `make_solver` for the format of the arena
+
+    Returns:
+        dict: {"commands", "distance", "path"}
+    """
+    maze_solver = make_solver(arena)
+    optimal_path, distance = maze_solver.get_optimal_order_dp(arena.get("retrying", False))
+    commands = command_generator(optimal_path, arena["obstacles"], cell_size=maze_solver.cell_size)
+
+    return {
+        "commands": commands,
+        "distance": float(distance),
+        "path": [state.get_dict() for state in optimal_path],
+    }
+
+
+class BatchStats:
+    """Aggregate counters of a `plan_batch` run, updated as the results come in"""
+
+    def __init__(self):
+        self.workers = 0
+        self.planned = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Arenas planned per second"""
+        return self.planned / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "workers": self.workers,
+            "planned": self.planned,
+            "failed": self.failed,
+            "elapsed_s": round(self.elapsed, 3),
+            "arenas_per_s": round(self.throughput, 2),
+        }
+
+
+def plan_batch(
+    arenas: Iterable[dict],
+    workers: Optional[int] = None,
+    stats: Optional[BatchStats] = None,
+) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Plan many arenas in parallel, yielding every plan as soon as it is done
+
+    Every worker process imports the planner once, builds the tables shared by every arena (see `warm_up`) and
+    plans many arenas. The successor tables depend on the obstacles and are built per arena, by filtering the moves
+    of the obstacle-free grid.
+
+    Args:
+        arenas (Iterable[dict]): arenas to plan, see `make_solver` for the format
+        workers (int, optional): number of worker processes, None for one per CPU
+        stats (BatchStats, optional): updated with the aggregate counters and throughput as the plans come in
+
+    Yields:
+        Tuple[int, dict, str]: index of the arena, its plan from `plan_arena` (None if planning failed) and the
+            error (None if planning succeeded), in the order the plans finish
+    """
+    arenas = list(arenas)
+    if stats is None:
+        stats = BatchStats()
+    stats.workers = workers or os.cpu_count()
+    stats.start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up, initargs=(WIDTH, HEIGHT)) as executor:
+        futures = {executor.submit(plan_arena, arena): idx for idx, arena in enumerate(arenas)}
+        try:
+            for future in as_completed(futures):
+                try:
+                    result, error = future.result(), None
+                    stats.planned += 1
+                except Exception as e:
+                    result, error = None, repr(e)
+                    stats.failed += 1
+                stats.elapsed = time.perf_counter() - stats.start
+
+                yield futures[future], result, error
+        finally:
+            # The caller stopped early, do not plan the remaining arenas
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,252 @@
+import argparse
+import json
+import re
+from typing import Iterable, Optional
+from consts import CELL_SIZE, TURN_FACTOR, Direction
+
+# Straight commands (FW/BW), turns (FR/FL/BR/BL) and pictures (SC) of `helper.command_generator`
+STRAIGHT_COMMAND = re.compile(r"^(FW|BW)([\d.]+)$")
+TURN_COMMAND = re.compile(r"^(FR|FL|BR|BL)\d+$")
+SNAP_COMMAND = re.compile(r"^SC")
+
+
+class StepCostModel:
+    """
+    Cost of the moves of the search in grid steps: every straight step costs 1, and a turn costs its rotation times
+    TURN_FACTOR, plus 1 and a turn penalty of 10 cells of CELL_SIZE. This is the default cost model of MazeSolver.
+
+    A cost model gives the integer cost of every move of the obstacle-free grid (`move_cost`), the factor that the
+    safe costs, which are in steps, are converted to its units with (`penalty_factor`), the cost of the view position
+    penalties, which are distances in cells of the grid (`penalty_cost`), and the cost of taking a picture
+    (`snap_cost`). `key` identifies the model and its parameters, as the tables
+    built with it are shared by every MazeSolver using an equal model.
+    """
+
+    penalty_factor = 1
+    snap_cost = 0
+
+    @property
+    def key(self):
+        return ("steps",)
+
+    def move_cost(self, direction: Direction, new_direction: Direction, scale: int) -> int:
+        """Cost of moving one cell straight, or of turning from direction to new_direction
+
+        Args:
+            direction (Direction): direction before the move
+            new_direction (Direction): direction after the move, the same for straight moves
+            scale (int): number of cells per cell of CELL_SIZE, see MazeSolver
+
+        Returns:
+            int: cost of the move, without safe costs
+        """
+        if direction == new_direction:
+            return 1
+        return Direction.rotation_cost(new_direction, direction) * TURN_FACTOR + 1 + 10 * scale
+
+    def penalty_cost(self, penalty: float, scale: int) -> float:
+        """Cost of a view position penalty
+
+        Args:
+            penalty (float): penalty of the view position, in cells of the grid
+            scale (int): number of cells per cell of CELL_SIZE, see MazeSolver
+
+        Returns:
+            float: the penalty, as steps are the units of this model
+        """
+        return penalty
+
+
+class ExecutionTimeCostModel:
+    """
+    Cost of the moves of the search in milliseconds of execution by the robot, so that the planner minimises the
+    run time rather than the number of cells.
+
+    The robot runs the commands of `helper.command_generator`: every command has a fixed latency, straight commands
+    also accelerate and decelerate before covering their distance at a constant speed, turns take a fixed time and
+    pictures a fixed dwell time. A move of the search does not know which command it ends up in, so the overhead
+    of a straight command is charged to the turn before it, and straight steps are charged their share of the
+    overhead of splitting runs longer than `max_straight`. `estimate_run_time` gives the time of the commands
+    themselves.
+    """
+
+    def __init__(
+        self,
+        speed: float = 20.0,
+        command_latency_ms: float = 100.0,
+        acceleration_ms: float = 300.0,
+        turn_ms: float = 2500.0,
+        snap_ms: float = 1000.0,
+        max_straight: Optional[float] = 90,
+    ):
+        """
+        Args:
+            speed (float, optional): straight speed in cm/s. Defaults to 20.
+            command_latency_ms (float, optional): time between commands. Defaults to 100.
+            acceleration_ms (float, optional): time a straight command takes on top of its distance at full speed,
+                for accelerating and decelerating. Defaults to 300.
+            turn_ms (float, optional): time of a 90 degree turn. Defaults to 2500.
+            snap_ms (float, optional): time of taking a picture. Defaults to 1000.
+            max_straight (float, optional): longest straight command in cm, see `helper.command_generator`.
+                Defaults to 90.
+        """
+        self.speed = speed
+        self.command_latency_ms = command_latency_ms
+        self.acceleration_ms = acceleration_ms
+        self.turn_ms = turn_ms
+        self.snap_ms = snap_ms
+        self.max_straight = max_straight
+
+        # Safe costs are in steps, i.e. cells of CELL_SIZE
+        self.penalty_factor = round(CELL_SIZE / speed * 1000)
+        self.snap_cost = round(command_latency_ms + snap_ms)
+
+    @property
+    def key(self):
+        return (
+            "time",
+            self.speed,
+            self.command_latency_ms,
+            self.acceleration_ms,
+            self.turn_ms,
+            self.snap_ms,
+            self.max_straight,
+        )
+
+    def move_cost(self, direction: Direction, new_direction: Direction, scale: int) -> int:
+        """Milliseconds of moving one cell straight, or of turning from direction to new_direction
+
+        Args:
+            direction (Direction): direction before the move
+            new_direction (Direction): direction after the move, the same for straight moves
+            scale (int): number of cells per cell of CELL_SIZE, see MazeSolver
+
+        Returns:
+            int: time of the move in ms, without safe costs
+        """
+        straight_overhead = self.command_latency_ms + self.acceleration_ms
+        if direction == new_direction:
+            cell_size = CELL_SIZE / scale
+            split_share = 0 if self.max_straight is None else straight_overhead * cell_size / self.max_straight
+            return max(1, round(cell_size / self.speed * 1000 + split_share))
+
+        quarter_turns = Direction.rotation_cost(new_direction, direction) // 2
+        return round(quarter_turns * (self.command_latency_ms + self.turn_ms) + straight_overhead)
+
+    def penalty_cost(self, penalty: float, scale: int) -> float:
+        """Milliseconds of driving the distance of a view position penalty
+
+        Args:
+            penalty (float): penalty of the view position, in cells of the grid, which are already scaled
+            scale (int): number of cells per cell of CELL_SIZE, see MazeSolver
+
+        Returns:
+            float: time of the penalty in ms
+        """
+        return penalty * CELL_SIZE / scale / self.speed * 1000
+
+    def command_time(self, command: str) -> float:
+        """Milliseconds the robot takes to run one command
+
+        Args:
+            command (str): command of `helper.command_generator`, such as "FW30", "FR90", "SC1L" or "FIN"
+
+        Returns:
+            float: time of the command in ms, 0 for FIN
+        """
+        straight = STRAIGHT_COMMAND.match(command)
+        if straight:
+            distance = float(straight.group(2))
+            return self.command_latency_ms + self.acceleration_ms + distance / self.speed * 1000
+        if TURN_COMMAND.match(command):
+            return self.command_latency_ms + self.turn_ms
+        if SNAP_COMMAND.match(command):
+            return self.command_latency_ms + self.snap_ms
+        if command == "FIN":
+            return 0.0
+        raise ValueError(f"Unknown command {command}")
+
+
+# Cost models by the name that requests choose them with, see `get_cost_model`
+COST_MODELS = {
+    "steps": StepCostModel,
+    "time": ExecutionTimeCostModel,
+}
+
+
+def get_cost_model_name(name: Optional[str]) -> str:
+    """Validate the name of a cost model
+
+    Args:
+        name (str, optional): name of a cost model of COST_MODELS, None for the default "steps"
+
+    Raises:
+        ValueError: if there is no cost model of that name
+
+    Returns:
+        str: the name of the cost model
+    """
+    if name is None:
+        return "steps"
+    if name not in COST_MODELS:
+        raise ValueError(f"Unknown cost model {name!r}, expected one of {sorted(COST_MODELS)}")
+    return name
+
+
+def get_cost_model(name: Optional[str]):
+    """Create the cost model of a name, with its default parameters
+
+    Args:
+        name (str, optional): name of a cost model of COST_MODELS, None for the default "steps"
+
+    Raises:
+        ValueError: if there is no cost model of that name
+
+    Returns:
+        StepCostModel or ExecutionTimeCostModel: the cost model
+    """
+    return COST_MODELS[get_cost_model_name(name)]()
+
+
+def estimate_run_time(commands: Iterable[str], cost_model: Optional[ExecutionTimeCostModel] = None) -> float:
+    """Estimate how long the robot takes to run a plan
+
+    Args:
+        commands (Iterable[str]): commands of the plan, see `helper.command_generator`
+        cost_model (ExecutionTimeCostModel, optional): timings of the robot. Defaults to the default timings.
+
+    Returns:
+        float: run time in seconds
+    """
+    if cost_model is None:
+        cost_model = ExecutionTimeCostModel()
+    return sum(cost_model.command_time(command) for command in commands) / 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the run time of the plans of algo_server responses")
+    parser.add_argument("plans", nargs="+", help='JSON files with the "commands" of a plan, or a server response')
+    parser.add_argument("--speed", type=float, default=20.0, help="straight speed in cm/s")
+    parser.add_argument("--command-latency-ms", type=float, default=100.0)
+    parser.add_argument("--acceleration-ms", type=float, default=300.0)
+    parser.add_argument("--turn-ms", type=float, default=2500.0)
+    parser.add_argument("--snap-ms", type=float, default=1000.0)
+    parser.add_argument(
+        "--max-straight", type=float, default=90, help="longest straight command in cm, 0 for no limit"
+    )
+    args = parser.parse_args()
+
+    model = ExecutionTimeCostModel(
+        args.speed,
+        args.command_latency_ms,
+        args.acceleration_ms,
+        args.turn_ms,
+        args.snap_ms,
+        args.max_straight or None,
+    )
+    for path in args.plans:
+        with open(path) as f:
+            plan = json.load(f)
+        # Server responses hold the plan under "data"
+        plan = plan.get("data", plan)
+        print(f"{path}: {estimate_run_time(plan['commands'], model):.2f} s, {len(plan['commands'])} commands")
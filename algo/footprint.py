@@ -0,0 +1,225 @@
+import math
+from typing import Dict, Iterable, List, Tuple
+from consts import Direction, OBS_DIM, ROBOT_DIM
+
+# Positions of the robot sampled along every turn, the robot rotates by 90 / TURN_SAMPLES degrees between two of them
+TURN_SAMPLES = 90
+
+# Tolerance of the overlap tests, so that the robot touching the edge of a cell does not cover it
+EPSILON = 1e-9
+
+# (x, y) of a step forward in every direction
+UNIT_HEADINGS = {
+    Direction.NORTH: (0, 1),
+    Direction.EAST: (1, 0),
+    Direction.SOUTH: (0, -1),
+    Direction.WEST: (-1, 0),
+}
+
+# Swept footprints of the straight moves by (direction, steps, scale) and of the turns by (direction, new direction,
+# dx, dy, scale), see get_straight_sweep and get_turn_sweep
+_straight_sweeps: Dict[Tuple, "Sweep"] = dict()
+_turn_sweeps: Dict[Tuple, "Sweep"] = dict()
+
+
+class Sweep:
+    """
+    Cells covered by the robot while it moves, relative to its position before the move.
+
+    A sweep is held as bitmasks of y per x, like the occupancy rasters of `occupancy_raster`: bit j of `masks[i]`
+    is the cell (x + min_dx + i, y + min_dy + j) of a robot moving from (x, y). Testing a move against a raster is
+    then a single AND per column of the sweep.
+    """
+
+    __slots__ = ("min_dx", "min_dy", "masks")
+
+    def __init__(self, cells: Iterable[Tuple[int, int]]):
+        """
+        Args:
+            cells (Iterable[Tuple[int, int]]): (dx, dy) of the covered cells, relative to the robot's position
+        """
+        cells = list(cells)
+        self.min_dx = min(dx for dx, _ in cells)
+        self.min_dy = min(dy for _, dy in cells)
+        self.masks = [0] * (max(dx for dx, _ in cells) - self.min_dx + 1)
+        for dx, dy in cells:
+            self.masks[dx - self.min_dx] |= 1 << (dy - self.min_dy)
+
+    def hits(self, raster: List[int], x: int, y: int) -> bool:
+        """Checks if the robot covers an occupied cell while moving from (x, y). Cells outside the raster are free
+
+        Args:
+            raster (List[int]): bitmask of the occupied y per x, see `occupancy_raster`
+            x (int): x-coordinate of the robot before the move
+            y (int): y-coordinate of the robot before the move
+
+        Returns:
+            bool: True if the sweep hits an occupied cell, False otherwise
+        """
+        low_x, low_y = x + self.min_dx, y + self.min_dy
+        first = max(-low_x, 0)
+        for column, mask in zip(raster[low_x + first :], self.masks[first:]):
+            if (column >> low_y if low_y >= 0 else column << -low_y) & mask:
+                return True
+        return False
+
+
+def footprint_cells(x: float, y: float, heading_x: float, heading_y: float, scale: int) -> List[Tuple[int, int]]:
+    """Cells covered by the robot, a square of ROBOT_DIM cells of CELL_SIZE, centred at (x, y) and facing a heading
+
+    Cells are unit squares, cell (i, j) spanning [i, i + 1] x [j, j + 1], and a cell is covered if it overlaps the
+    robot by more than EPSILON, checked with the separating axis test.
+
+    Args:
+        x (float): x-coordinate of the centre of the robot
+        y (float): y-coordinate of the centre of the robot
+        heading_x (float): x of the unit vector the robot faces
+        heading_y (float): y of the unit vector the robot faces
+        scale (int): number of cells per cell of CELL_SIZE
+
+    Returns:
+        List[Tuple[int, int]]: (i, j) of the covered cells
+    """
+    half = ROBOT_DIM * scale / 2
+    # Half of the extent of the robot along x and y
+    extent_x = half * (abs(heading_x) + abs(heading_y))
+    extent_y = half * (abs(heading_y) + abs(heading_x))
+    # Half of the extent of a cell along the heading and its normal
+    cell_extent = 0.5 * (abs(heading_x) + abs(heading_y))
+
+    cells = []
+    for i in range(math.floor(x - extent_x), math.ceil(x + extent_x)):
+        for j in range(math.floor(y - extent_y), math.ceil(y + extent_y)):
+            dx, dy = i + 0.5 - x, j + 0.5 - y
+            if abs(dx) >= extent_x + 0.5 - EPSILON or abs(dy) >= extent_y + 0.5 - EPSILON:
+                continue
+            if abs(dx * heading_x + dy * heading_y) >= half + cell_extent - EPSILON:
+                continue
+            if abs(dy * heading_x - dx * heading_y) >= half + cell_extent - EPSILON:
+                continue
+            cells.append((i, j))
+    return cells
+
+
+def get_straight_sweep(direction: Direction, steps: int, scale: int) -> Sweep:
+    """Returns the cells covered by the robot moving straight, relative to its position before the move
+
+    Args:
+        direction (Direction): direction of the robot
+        steps (int): number of cells moved, negative to move backward
+        scale (int): number of cells per cell of CELL_SIZE
+
+    Returns:
+        Sweep: cells covered by the robot
+    """
+    key = (direction, steps, scale)
+    if key not in _straight_sweeps:
+        # The robot covers x - scale to x + 2 * scale - 1, see get_turn_sweep
+        start_x, start_y = -scale, -scale
+        end_x, end_y = start_x + UNIT_HEADINGS[direction][0] * steps, start_y + UNIT_HEADINGS[direction][1] * steps
+        size = ROBOT_DIM * scale
+        _straight_sweeps[key] = Sweep(
+            (dx, dy)
+            for dx in range(min(start_x, end_x), max(start_x, end_x) + size)
+            for dy in range(min(start_y, end_y), max(start_y, end_y) + size)
+        )
+
+    return _straight_sweeps[key]
+
+
+def get_turn_sweep(direction: Direction, new_direction: Direction, dx: int, dy: int, scale: int) -> Sweep:
+    """Returns the cells covered by the robot turning, relative to its position before the turn
+
+    The robot covers x - scale to x + 2 * scale - 1 and y - scale to y + 2 * scale - 1 at (x, y), like the clearance
+    rules of `Grid.reachable` assume. It moves by (dx, dy) along a quarter of an ellipse: at angle t from 0 to 90
+    degrees, its centre is p0 + a * sin(t) * h0 + c * (1 - cos(t)) * h1 and it faces cos(t) * h0 + sin(t) * h1,
+    wherein h0 and h1 are the headings before and after the turn and a and c are the displacements along them. The
+    robot is sampled at TURN_SAMPLES + 1 angles and the sweeps are cached, as they only depend on the turn and the
+    scale.
+
+    Args:
+        direction (Direction): direction of the robot before the turn
+        new_direction (Direction): direction of the robot after the turn
+        dx (int): displacement of the turn along x, in cells
+        dy (int): displacement of the turn along y, in cells
+        scale (int): number of cells per cell of CELL_SIZE
+
+    Returns:
+        Sweep: cells covered by the robot
+    """
+    key = (direction, new_direction, dx, dy, scale)
+    if key not in _turn_sweeps:
+        h0_x, h0_y = UNIT_HEADINGS[direction]
+        h1_x, h1_y = UNIT_HEADINGS[new_direction]
+        a = dx * h0_x + dy * h0_y
+        c = dx * h1_x + dy * h1_y
+        # The robot at (x, y) covers x - scale to x + 2 * scale - 1 (ROBOT_DIM cells of CELL_SIZE), so its centre
+        # is half a scale up and right of (x, y)
+        centre = 0.5 * scale
+        cells = set()
+        for sample in range(TURN_SAMPLES + 1):
+            t = math.pi / 2 * sample / TURN_SAMPLES
+            along, across = a * math.sin(t), c * (1 - math.cos(t))
+            cells.update(
+                footprint_cells(
+                    centre + along * h0_x + across * h1_x,
+                    centre + along * h0_y + across * h1_y,
+                    math.cos(t) * h0_x + math.sin(t) * h1_x,
+                    math.cos(t) * h0_y + math.sin(t) * h1_y,
+                    scale,
+                )
+            )
+        _turn_sweeps[key] = Sweep(cells)
+
+    return _turn_sweeps[key]
+
+
+def occupancy_raster(obstacles: Iterable[Tuple[int, int]], size_x: int, size_y: int, scale: int) -> List[int]:
+    """Rasterise the obstacles, each covering OBS_DIM x OBS_DIM cells of CELL_SIZE from its position
+
+    Args:
+        obstacles (Iterable[Tuple[int, int]]): (x, y) of the obstacles
+        size_x (int): size of the grid in the x direction
+        size_y (int): size of the grid in the y direction
+        scale (int): number of cells per cell of CELL_SIZE
+
+    Returns:
+        List[int]: bitmask of the occupied y per x
+    """
+    size = OBS_DIM * scale
+    raster = [0] * size_x
+    for ob_x, ob_y in obstacles:
+        low_y = max(ob_y, 0)
+        column = ((1 << max(min(ob_y + size, size_y) - low_y, 0)) - 1) << low_y
+        for x in range(max(ob_x, 0), min(ob_x + size, size_x)):
+            raster[x] |= column
+    return raster
+
+
+def find_collisions(states, obstacles: Iterable[Tuple[int, int]], size_x: int, size_y: int, scale: int) -> List[int]:
+    """Sweep the robot footprint along a path, one straight move or turn at a time
+
+    Args:
+        states (List[CellState]): states of the path, such as the path of `MazeSolver.get_optimal_order_dp`
+        obstacles (Iterable[Tuple[int, int]]): (x, y) of the obstacles
+        size_x (int): size of the grid in the x direction
+        size_y (int): size of the grid in the y direction
+        scale (int): number of cells per cell of CELL_SIZE
+
+    Returns:
+        List[int]: indices of the states whose move from the previous state hits an obstacle, empty if the path is
+            collision-free
+    """
+    raster = occupancy_raster(obstacles, size_x, size_y, scale)
+    collisions = []
+    for index in range(1, len(states)):
+        prev, state = states[index - 1], states[index]
+        dx, dy = state.x - prev.x, state.y - prev.y
+        if state.direction == prev.direction:
+            heading_x, heading_y = UNIT_HEADINGS[state.direction]
+            sweep = get_straight_sweep(state.direction, dx * heading_x + dy * heading_y, scale)
+        else:
+            sweep = get_turn_sweep(prev.direction, state.direction, dx, dy, scale)
+        if sweep.hits(raster, prev.x, prev.y):
+            collisions.append(index)
+    return collisions
@@ -0,0 +1,93 @@
+import heapq
+from typing import List
+from consts import Direction
+from algo.successors import SuccessorTable
+
+# Bound of the states that cannot reach each other even without obstacles
+UNREACHABLE = 1 << 30
+
+
+class HeuristicTable:
+    """
+    Lower bounds of the path cost between any two states of a size_x by size_y grid, whatever its obstacles.
+
+    The bounds are the exact path costs on an obstacle-free grid of size (2 * size_x - 1) by (2 * size_y - 1), centred
+    on the end state. Every path of the real grid fits in that grid once moved so that its end is at the centre, and
+    obstacles only remove moves or add safe costs, so the bounds are admissible and consistent A* heuristics. They
+    account for the direction at both ends, unlike the Manhattan distance.
+
+    The bounds are held in `bounds[end direction index, start direction index, dx + size_x - 1, dy + size_y - 1]`,
+    wherein (dx, dy) is the position of the start relative to the end and the direction index is direction // 2.
+    """
+
+    def __init__(self, size_x: int, size_y: int, free_table: SuccessorTable):
+        """
+        Args:
+            size_x (int): Size of the real grid in the x direction
+            size_y (int): Size of the real grid in the y direction
+            free_table (SuccessorTable): Successors of the obstacle-free grid of size (2 * size_x - 1) by
+                (2 * size_y - 1), see `MazeSolver.get_heuristic_table`
+        """
+        import numpy as np
+
+        self.size_x = size_x
+        self.size_y = size_y
+
+        self.bounds = np.full(
+            (4, 4, free_table.size_x, free_table.size_y), UNREACHABLE, dtype=np.int64
+        )
+        for end_direction in (Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST):
+            # Search backwards from the centre, giving the cost from every state to it
+            distances = self._reverse_dijkstra(
+                free_table, free_table.state_id(size_x - 1, size_y - 1, end_direction)
+            )
+            # State ids are ordered by x, then y, then direction index
+            self.bounds[end_direction // 2] = np.array(distances, dtype=np.int64).reshape(
+                free_table.size_x, free_table.size_y, 4
+            ).transpose(2, 0, 1)
+
+    @staticmethod
+    def _reverse_dijkstra(table: SuccessorTable, end_id: int) -> List[int]:
+        """Path cost from every state of the table to the end state, UNREACHABLE if there is no path"""
+        reverse_offsets, sources, reverse_costs = table.reverse_offsets, table.sources, table.reverse_costs
+        distances = [UNREACHABLE] * len(table)
+        distances[end_id] = 0
+        heap = [(0, end_id)]
+        while heap:
+            cur_distance, cur_id = heapq.heappop(heap)
+            if cur_distance > distances[cur_id]:
+                continue
+            for k in range(reverse_offsets[cur_id], reverse_offsets[cur_id + 1]):
+                next_distance = cur_distance + reverse_costs[k]
+                if next_distance < distances[sources[k]]:
+                    distances[sources[k]] = next_distance
+                    heapq.heappush(heap, (next_distance, sources[k]))
+        return distances
+
+    def bounds_to(self, x: int, y: int, direction: Direction) -> List[int]:
+        """Lower bounds of the path cost from every state of the real grid to the given state
+
+        Returns:
+            List[int]: bounds indexed by the state ids of the real grid's SuccessorTable
+        """
+        window = self.bounds[
+            direction // 2,
+            :,
+            self.size_x - 1 - x:2 * self.size_x - 1 - x,
+            self.size_y - 1 - y:2 * self.size_y - 1 - y,
+        ]
+        return window.transpose(1, 2, 0).ravel().tolist()
+
+    def bounds_from(self, x: int, y: int, direction: Direction) -> List[int]:
+        """Lower bounds of the path cost from the given state to every state of the real grid
+
+        Returns:
+            List[int]: bounds indexed by the state ids of the real grid's SuccessorTable
+        """
+        import numpy as np
+
+        # The given state is the start, so it is at -(dx, dy) relative to every end state
+        xs = x - np.arange(self.size_x) + self.size_x - 1
+        ys = y - np.arange(self.size_y) + self.size_y - 1
+        window = self.bounds[:, direction // 2][:, xs][:, :, ys]
+        return window.transpose(1, 2, 0).ravel().tolist()
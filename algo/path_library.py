@@ -0,0 +1,168 @@
+import argparse
+import heapq
+import mmap
+import struct
+from array import array
+from typing import List, Optional
+from consts import CELL_SIZE, Direction, TURN_FACTOR, TURN_RADIUS, WIDTH, HEIGHT
+from algo.successors import SuccessorTable
+
+MAGIC = b"MDPPATHS"
+FORMAT_VERSION = 2
+# magic, format version, size_x, size_y, big_turn, scale, TURN_FACTOR, TURN_RADIUS, number of states
+HEADER = struct.Struct("<8s8i")
+# Distance of the states that cannot be reached
+UNREACHABLE = -1
+
+
+class PathLibrary:
+    """
+    Optimal paths between every pair of states of an obstacle-free grid, read from a file built by `build`.
+
+    For every source state the file holds the shortest path tree of the obstacle-free grid: the cost to every state
+    (int32) and the parent of every state on its path from the source (int16), as two (states x states) arrays
+    indexed by the state ids of SuccessorTable. The file is memory-mapped, so opening it is instant, it is shared
+    between the processes that open it, and paths are read without copying the arrays.
+
+    A path of the obstacle-free grid is also the optimal path of a grid with obstacles if none of its moves got more
+    expensive or impossible, as obstacles can only remove moves or add safe costs. `get_path` checks that against the
+    successor table of the real grid.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): File built by `build`
+
+        Raises:
+            ValueError: if the file is not a path library or was built with other turning constants
+        """
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic, version, self.size_x, self.size_y, self.big_turn, self.scale, turn_factor, turn_radius, n
+        ) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a path library of version {FORMAT_VERSION}")
+        if (turn_factor, turn_radius) != (TURN_FACTOR, TURN_RADIUS):
+            raise ValueError(
+                f"{path} was built with TURN_FACTOR={turn_factor}, TURN_RADIUS={turn_radius}, rebuild it"
+            )
+
+        self.n_states = n
+        view = memoryview(self._mmap)
+        costs_start = HEADER.size
+        parents_start = costs_start + 4 * n * n
+        self.costs = view[costs_start:parents_start].cast("i")
+        self.parents = view[parents_start:parents_start + 2 * n * n].cast("h")
+
+    def get_path(self, start_id: int, end_id: int, table: SuccessorTable) -> Optional[List[int]]:
+        """Read the optimal path between two states, if it is still optimal on the grid of the table
+
+        Args:
+            start_id (int): state id of the start
+            end_id (int): state id of the end
+            table (SuccessorTable): successor table of the real grid, of the same size and turning mode
+
+        Returns:
+            List[int]: the state ids of the path from start to end, None if an obstacle is in its way
+        """
+        row = start_id * self.n_states
+        if self.costs[row + end_id] == UNREACHABLE:
+            return None
+
+        path = [end_id]
+        while path[-1] != start_id:
+            path.append(self.parents[row + path[-1]])
+        path.reverse()
+
+        # Every move of the path must still be possible, at the cost it has without obstacles
+        offsets, targets, costs = table.offsets, table.targets, table.costs
+        for cur_id, next_id in zip(path, path[1:]):
+            move_cost = self.costs[row + next_id] - self.costs[row + cur_id]
+            for k in range(offsets[cur_id], offsets[cur_id + 1]):
+                if targets[k] == next_id and costs[k] == move_cost:
+                    break
+            else:
+                return None
+
+        return path
+
+    def cost(self, start_id: int, end_id: int) -> int:
+        """Cost of the optimal path between two states of the obstacle-free grid, UNREACHABLE if there is none"""
+        return self.costs[start_id * self.n_states + end_id]
+
+
+def build(output: str, table: SuccessorTable, big_turn: int, scale: int = 1):
+    """Build the path library of an obstacle-free grid and write it to a file
+
+    Args:
+        output (str): file to write
+        table (SuccessorTable): successor table of the obstacle-free grid
+        big_turn (int): turning mode of the table, 0 for 3-1 turns and 1 for 4-2 turns
+        scale (int, optional): scale of the grid of the table, see MazeSolver. Defaults to 1.
+    """
+    n = len(table)
+    if n > 1 << 15:
+        raise ValueError(f"{n} states do not fit the 16-bit parents of the path library")
+    with open(output, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC, FORMAT_VERSION, table.size_x, table.size_y, big_turn, scale, TURN_FACTOR, TURN_RADIUS, n
+            )
+        )
+
+        # Write the costs of every source, then the parents of every source
+        trees = [_shortest_path_tree(table, source) for source in range(n)]
+        for costs, _ in trees:
+            costs.tofile(f)
+        for _, parents in trees:
+            parents.tofile(f)
+
+
+def _shortest_path_tree(table: SuccessorTable, source: int):
+    """Dijkstra search from the source over the whole table
+
+    Returns:
+        Tuple[array, array]: the cost of every state (UNREACHABLE if there is no path) and its parent (-1 for none)
+    """
+    costs = array("i", [UNREACHABLE]) * len(table)
+    parents = array("h", [-1]) * len(table)
+    settled = bytearray(len(table))
+
+    costs[source] = 0
+    heap = [(0, source)]
+    while heap:
+        cur_cost, cur_id = heapq.heappop(heap)
+        if settled[cur_id]:
+            continue
+        settled[cur_id] = 1
+
+        for k in range(table.offsets[cur_id], table.offsets[cur_id + 1]):
+            next_id = table.targets[k]
+            next_cost = cur_cost + table.costs[k]
+            if not settled[next_id] and (costs[next_id] == UNREACHABLE or costs[next_id] > next_cost):
+                costs[next_id] = next_cost
+                parents[next_id] = cur_id
+                heapq.heappush(heap, (next_cost, next_id))
+
+    return costs, parents
+
+
+if __name__ == "__main__":
+    from algo.algo import MazeSolver, get_scale
+
+    parser = argparse.ArgumentParser(description="Precompute the paths of the obstacle-free arena")
+    parser.add_argument("output", help="file to write the path library to")
+    parser.add_argument("--big-turn", type=int, default=0, help="0 for 3-1 turns, 1 for 4-2 turns")
+    parser.add_argument("--cell-size", type=float, default=CELL_SIZE, help="size of a cell in cm")
+    parser.add_argument("--size-x", type=int, help="defaults to the arena's width in cells of the cell size")
+    parser.add_argument("--size-y", type=int, help="defaults to the arena's height in cells of the cell size")
+    args = parser.parse_args()
+
+    scale = get_scale(args.cell_size)
+    size_x = args.size_x or WIDTH * scale
+    size_y = args.size_y or HEIGHT * scale
+    free_solver = MazeSolver(size_x, size_y, 1, 1, Direction.NORTH, big_turn=args.big_turn, cell_size=args.cell_size)
+    build(args.output, free_solver.get_successor_table(), args.big_turn, scale)
@@ -0,0 +1,47 @@
+import time
+from contextlib import contextmanager
+
+
+class PlannerStats:
+    """
+    Timings and counters of one plan of a MazeSolver, see `MazeSolver.get_optimal_order_dp`.
+
+    Stages are timed in seconds: "view_positions" (generating the view positions), "path_costs" (generating the path
+    costs), "combinations" (enumerating the subsets of obstacles to visit) and "tsp" (building and solving the set TSP
+    tables). Counting only adds a few integer increments per search, so it is cheap enough to leave on.
+    """
+
+    def __init__(self):
+        self.stage_seconds = dict()
+        # Nodes popped from and pushed onto the heaps of the path searches
+        self.nodes_expanded = 0
+        self.nodes_pushed = 0
+        # Pairs of states whose path was already in the path table or read from the path library, and searches
+        # run for the others
+        self.path_cache_hits = 0
+        self.path_library_hits = 0
+        self.path_searches = 0
+        # Set TSP solves read from the tables, and subsets of obstacles tried in order
+        self.tsp_solves = 0
+        self.subsets_tried = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed code, adding it to the stage's total"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def as_dict(self) -> dict:
+        return {
+            "stage_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stage_seconds.items()},
+            "nodes_expanded": self.nodes_expanded,
+            "nodes_pushed": self.nodes_pushed,
+            "path_cache_hits": self.path_cache_hits,
+            "path_library_hits": self.path_library_hits,
+            "path_searches": self.path_searches,
+            "tsp_solves": self.tsp_solves,
+            "subsets_tried": self.subsets_tried,
+        }
@@ -0,0 +1,150 @@
+from array import array
+from typing import Callable, Iterable, List, Tuple
+from consts import Direction, TURN_FACTOR
+
+# Directions a state can have, ordered by their index in the state id
+STATE_DIRECTIONS = [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+
+
+class SuccessorTable:
+    """
+    Successors of every (x, y, direction) state of a grid, stored as flat arrays indexed by state id.
+
+    The successors of state `sid` are `targets[offsets[sid]:offsets[sid + 1]]`, and moving to `targets[k]` costs
+    `costs[k]` (turn cost, step cost and safe cost combined). The same edges are also stored by their end state for
+    searches that run backwards: the predecessors of state `sid` are `sources[reverse_offsets[sid]:reverse_offsets[sid + 1]]`,
+    and moving from `sources[k]` costs `reverse_costs[k]`. The reverse edges are only built when first used.
+    """
+
+    def __init__(
+        self,
+        size_x: int,
+        size_y: int,
+        neighbors: Callable[[int, int, Direction], Iterable[Tuple[int, int, Direction, int]]],
+    ):
+        """
+        Args:
+            size_x (int): Size of the grid in the x direction
+            size_y (int): Size of the grid in the y direction
+            neighbors (Callable): Returns the (x, y, direction, safe_cost) neighbours of a state,
+                such as MazeSolver.get_neighbors
+        """
+        offsets: List[int] = [0]
+        targets: List[int] = []
+        costs: List[int] = []
+        for x in range(size_x):
+            for y in range(size_y):
+                for direction in STATE_DIRECTIONS:
+                    for next_x, next_y, new_direction, safe_cost in neighbors(x, y, direction):
+                        targets.append((next_x * size_y + next_y) * 4 + new_direction // 2)
+                        costs.append(Direction.rotation_cost(new_direction, direction) * TURN_FACTOR + 1 + safe_cost)
+                    offsets.append(len(targets))
+
+        self._set_edges(size_x, size_y, offsets, targets, costs)
+
+    @classmethod
+    def from_edges(cls, size_x: int, size_y: int, offsets: List[int], targets: List[int], costs: List[int]):
+        """Create a table from edges that are already in its forward layout, without calling a neighbours function
+
+        Args:
+            size_x (int): Size of the grid in the x direction
+            size_y (int): Size of the grid in the y direction
+            offsets (List[int]): offsets of the successors of every state, see the class docstring
+            targets (List[int]): state id of every successor
+            costs (List[int]): cost of moving to every successor
+
+        Returns:
+            SuccessorTable: the table, which takes ownership of the lists
+        """
+        table = cls.__new__(cls)
+        table._set_edges(size_x, size_y, offsets, targets, costs)
+        return table
+
+    def _set_edges(self, size_x: int, size_y: int, offsets: List[int], targets: List[int], costs: List[int]):
+        self.size_x = size_x
+        self.size_y = size_y
+        self.states: List[Tuple[int, int, Direction]] = [
+            (x, y, direction) for x in range(size_x) for y in range(size_y) for direction in STATE_DIRECTIONS
+        ]
+        self.offsets = offsets
+        self.targets = targets
+        self.costs = costs
+        self._reverse = None
+
+    def _get_reverse(self):
+        # Group the same edges by their end state, on first use
+        if self._reverse is None:
+            edges_to = [[] for _ in self.states]
+            for sid in range(len(self.states)):
+                for k in range(self.offsets[sid], self.offsets[sid + 1]):
+                    edges_to[self.targets[k]].append((sid, self.costs[k]))
+
+            reverse_offsets: List[int] = [0]
+            sources: List[int] = []
+            reverse_costs: List[int] = []
+            for edges in edges_to:
+                for sid, cost in edges:
+                    sources.append(sid)
+                    reverse_costs.append(cost)
+                reverse_offsets.append(len(sources))
+            self._reverse = (reverse_offsets, sources, reverse_costs)
+
+        return self._reverse
+
+    @property
+    def reverse_offsets(self) -> List[int]:
+        return self._get_reverse()[0]
+
+    @property
+    def sources(self) -> List[int]:
+        return self._get_reverse()[1]
+
+    @property
+    def reverse_costs(self) -> List[int]:
+        return self._get_reverse()[2]
+
+    def __len__(self):
+        return len(self.states)
+
+    def state_id(self, x: int, y: int, direction: Direction) -> int:
+        """Encode a state as its index in the table
+
+        Args:
+            x (int): x coordinate
+            y (int): y coordinate
+            direction (Direction): direction of the state
+
+        Returns:
+            int: state id
+        """
+        return (x * self.size_y + y) * 4 + direction // 2
+
+
+class SearchBuffers:
+    """
+    Per-state scratch arrays of the searches over a SuccessorTable, indexed by state id and reused from one search to
+    the next.
+
+    `distance[sid]` and `parent[sid]` are only set for the current search if `reached[sid]` equals `generation`, and
+    the state is settled if `settled[sid]` equals `generation`, so starting a new search does not clear the arrays.
+    """
+
+    def __init__(self, size: int):
+        """
+        Args:
+            size (int): Number of states, i.e. len(SuccessorTable)
+        """
+        self.distance = array("q", [0]) * size
+        self.parent = array("q", [-1]) * size
+        self.reached = array("q", [0]) * size
+        self.settled = array("q", [0]) * size
+        self.generation = 0
+
+    def new_search(self) -> int:
+        """Invalidates every entry of the previous search
+
+        Returns:
+            int: the generation of the new search
+        """
+        self.generation += 1
+        return self.generation
@@ -1,7 +1,15 @@
-from functools import lru_cache
-from typing import Dict, List, Optional, Tuple
+from __future__ import annotations
 
-import numpy as np
+import math
+import time
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Largest (2^groups x nodes x nodes) work for which SetTSPTables is built with plain lists, above it numpy is faster
+# than its import time
+MAX_PURE_PYTHON_WORK = 100_000
 
 
 def solve_tsp_dynamic_programming(
@@ -18,9 +26,8 @@ def solve_tsp_dynamic_programming(
         distance from node i to j. It does not need to be symmetric
 
     maxsize
-        Parameter passed to ``lru_cache`` decorator. Used to define the maximum
-        size for the recursion tree. Defaults to `None`, which essentially
-        means "take as much space as needed".
+        Unused, kept for compatibility with the previous ``lru_cache`` based
+        implementation.
 
     Returns
     -------
@@ -85,39 +92,357 @@ def solve_tsp_dynamic_programming(
     Then, since the next step would be memo[2, {}], stop there. The optimal
     path would be 0 -> 1 -> 2 -> 0.
 
+    Implementation
+    ~~~~~~~~~~~~~~
+    Instead of recursing on frozensets, N is represented as a bitmask and
+    dist/memo are stored as (2^(n-1), n) arrays indexed by [N, ni]. The
+    subproblems are solved iteratively, one layer of equally sized N at a
+    time, with the minimum over nj vectorised across the whole layer. Ties
+    are broken towards the smallest nj.
+
     Reference
     ---------
     https://en.wikipedia.org/wiki/Held%E2%80%93Karp_algorithm#cite_note-5
     """
-    # Get initial set {1, 2, ..., tsp_size} as a frozenset because @lru_cache
-    # requires a hashable type
-    N = frozenset(range(1, distance_matrix.shape[0]))
-    memo: Dict[Tuple, int] = {}
+    import numpy as np
 
-    # Step 1: get minimum distance
-    @lru_cache(maxsize=maxsize)
-    def dist(ni: int, N: frozenset) -> float:
-        if not N:
-            return distance_matrix[ni, 0]
+    # Nodes 1, 2, ..., tsp_size are represented by the bits 0, 1, ..., tsp_size - 1 of a mask
+    distance_matrix = np.asarray(distance_matrix)
+    n = distance_matrix.shape[0]
+    full_mask = (1 << (n - 1)) - 1
+    masks = np.arange(full_mask + 1)
+    popcounts = np.zeros(full_mask + 1, dtype=np.int64)
+    for bit in range(n - 1):
+        popcounts += (masks >> bit) & 1
 
-        # Store the costs in the form (nj, dist(nj, N))
-        costs = [
-            (nj, distance_matrix[ni, nj] + dist(nj, N.difference({nj}))) for nj in N
-        ]
-        nmin, min_cost = min(costs, key=lambda x: x[1])
-        memo[(ni, N)] = nmin
-
-        return min_cost
-
-    best_distance = dist(0, N)
+    # Step 1: get minimum distance
+    # dist[N, ni] is the distance from ni, visiting all nodes in N and going back to 0
+    # memo[N, ni] is the node nj in N that provided the smallest value of dist[N, ni]
+    dist = np.empty((full_mask + 1, n))
+    memo = np.zeros((full_mask + 1, n), dtype=np.int64)
+    dist[0] = distance_matrix[:, 0]
+
+    # Solve the subproblems layer by layer, so that dist(nj, N - {nj}) is always known beforehand
+    for size in range(1, n):
+        layer = masks[popcounts == size]
+        best = np.full((len(layer), n), np.inf)
+        best_node = np.zeros((len(layer), n), dtype=np.int64)
+
+        for nj in range(1, n):
+            bit = 1 << (nj - 1)
+            rows = np.nonzero(layer & bit)[0]
+            # c_{ni, nj} + dist(nj, N - {nj}) for every N in the layer containing nj and every ni
+            costs = distance_matrix[:, nj][None, :] + dist[layer[rows] ^ bit, nj][:, None]
+            # Only replace on strict improvement, so that ties go to the smallest nj
+            better = costs < best[rows]
+            best[rows] = np.where(better, costs, best[rows])
+            best_node[rows] = np.where(better, nj, best_node[rows])
+
+        dist[layer] = best
+        memo[layer] = best_node
+
+    best_distance = dist[full_mask, 0]
 
     # Step 2: get path with the minimum distance
     ni = 0  # start at the origin
     solution = [0]
+    N = full_mask
 
     while N:
-        ni = memo[(ni, N)]
+        ni = int(memo[N, ni])
         solution.append(ni)
-        N = N.difference({ni})
+        N ^= 1 << (ni - 1)
 
     return solution, best_distance
+
+
+def solve_set_tsp_local_search(
+    distance_matrix: np.ndarray,
+    groups: List[List[int]],
+    node_costs: Optional[np.ndarray] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[List, float]:
+    """
+    Solve the generalised (set) TSP heuristically with local search
+
+    Same problem as `SetTSPTables`, but the path is built greedily (nearest
+    neighbour) and then improved until no move improves it or the deadline
+    passes, so the result is not necessarily optimal.
+
+    Parameters
+    ----------
+    distance_matrix
+        Distance matrix of shape (n x n) with the (i, j) entry indicating the
+        distance from node i to j. It does not need to be symmetric
+
+    groups
+        Disjoint lists of nodes (excluding node 0), one of which must be
+        visited per list
+
+    node_costs
+        Cost of shape (n,) added when a node is visited. Defaults to no cost
+
+    deadline
+        Value of ``time.perf_counter()`` at which to stop improving and
+        return the best path found so far. Defaults to no deadline
+
+    Returns
+    -------
+    permutation
+        Node 0 followed by the chosen node of every group, in visiting order
+
+    distance
+        The total distance (including node costs) the permutation produces
+
+    Notes
+    -----
+    The moves tried, in order, are:
+
+        - view swaps: visit another node of the same group
+        - 2-opt: reverse a section of the path
+        - Or-opt: move a section of 1 to 3 nodes elsewhere in the path
+
+    The first improving move found is applied, and the search starts over.
+    """
+    # Plain lists are much faster than numpy arrays for the scalar lookups below
+    dist = _as_lists(distance_matrix)
+    costs = [0.0] * len(dist) if node_costs is None else list(node_costs)
+    group_of = {node: g for g, nodes in enumerate(groups) for node in nodes}
+
+    def path_distance(path):
+        return sum(dist[a][b] + costs[b] for a, b in zip(path, path[1:]))
+
+    # Nearest neighbour: go to the closest node of a group that is not visited yet
+    path = [0]
+    left = set(range(len(groups)))
+    while left:
+        cur = path[-1]
+        _, node = min(
+            (dist[cur][node] + costs[node], node) for g in left for node in groups[g]
+        )
+        path.append(node)
+        left.discard(group_of[node])
+
+    best_distance = path_distance(path)
+    improved = True
+    while improved:
+        improved = False
+        for candidate in _local_search_moves(path, groups, group_of):
+            if deadline is not None and time.perf_counter() > deadline:
+                return path, best_distance
+
+            candidate_distance = path_distance(candidate)
+            if candidate_distance < best_distance:
+                path, best_distance = candidate, candidate_distance
+                improved = True
+                break
+
+    return path, best_distance
+
+
+def _local_search_moves(path: List[int], groups: List[List[int]], group_of: dict) -> Iterator[List[int]]:
+    """Every path one move away from the path, see `solve_set_tsp_local_search`"""
+    n = len(path)
+
+    # View swaps
+    for k in range(1, n):
+        for node in groups[group_of[path[k]]]:
+            if node != path[k]:
+                yield path[:k] + [node] + path[k + 1:]
+
+    # 2-opt, node 0 always stays first
+    for i in range(1, n - 1):
+        for j in range(i + 1, n):
+            yield path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+
+    # Or-opt
+    for length in (1, 2, 3):
+        for i in range(1, n - length + 1):
+            section = path[i:i + length]
+            rest = path[:i] + path[i + length:]
+            for k in range(1, len(rest) + 1):
+                if k != i:
+                    yield rest[:k] + section + rest[k:]
+
+
+def _as_lists(values):
+    """Plain (nested) lists of a numpy array or of a sequence of sequences"""
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    return [list(row) for row in values]
+
+
+class SetTSPTables:
+    """
+    Dynamic programming tables of the generalised (set) TSP, from which the optimal path visiting any subset of the
+    groups can be read without solving again.
+
+    Starting from node 0, exactly one node of every group has to be visited, and the path is open, i.e. it does not
+    go back to node 0 at the end. This is the Held-Karp recursion of `solve_tsp_dynamic_programming` with the DP
+    state extended to (visited groups, chosen node):
+
+        dist(M, nj) =   min   ( dist(M - {g(nj)}, ni) + c_{ni, nj} ) + p_{nj}
+                      ni in M - {g(nj)}
+
+    with dist({g(nj)}, nj) = c_{0, nj} + p_{nj}, wherein M is the set of visited groups as a bitmask, g(nj) the group
+    of node nj and p_{nj} its node cost. The optimal path visiting the groups of M ends at the nj minimising
+    dist(M, nj).
+
+    Small tables are built with plain lists, so that planning does not have to import numpy, and larger ones with
+    numpy; both break ties the same way. If a deadline is given and passes before the tables are complete, building
+    stops and `complete` is False; the tables must not be solved then.
+    """
+
+    def __init__(
+        self,
+        distance_matrix: np.ndarray,
+        groups: List[List[int]],
+        node_costs: Optional[np.ndarray] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.complete = False
+        n = len(distance_matrix)
+        self.full_mask = (1 << len(groups)) - 1
+
+        if (self.full_mask + 1) * n * n <= MAX_PURE_PYTHON_WORK:
+            tables = self._build_lists(distance_matrix, groups, node_costs, deadline)
+        else:
+            tables = self._build_arrays(distance_matrix, groups, node_costs, deadline)
+        if tables is None:
+            return
+
+        # dist[M][nj] and memo[M][nj], the node visited before nj on the best path
+        self.dist, self.memo, self.group_bit = tables
+        self.complete = True
+
+    def _build_lists(self, distance_matrix, groups, node_costs, deadline):
+        """Build the tables with plain lists, None if the deadline passed"""
+        distance_matrix = _as_lists(distance_matrix)
+        n = len(distance_matrix)
+        node_costs = [0.0] * n if node_costs is None else list(node_costs)
+
+        group_bit = [0] * n
+        for g, nodes in enumerate(groups):
+            for node in nodes:
+                group_bit[node] = 1 << g
+        grouped = [node for node in range(n) if group_bit[node]]
+
+        dist = [[math.inf] * n for _ in range(self.full_mask + 1)]
+        memo = [[0] * n for _ in range(self.full_mask + 1)]
+        for node in grouped:
+            dist[group_bit[node]][node] = distance_matrix[0][node] + node_costs[node]
+
+        columns = list(zip(*distance_matrix))
+        for mask in range(1, self.full_mask):
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+
+            row = dist[mask]
+            reached = [prev for prev in range(n) if row[prev] != math.inf]
+            if not reached:
+                continue
+
+            for node in grouped:
+                if group_bit[node] & mask:
+                    continue
+                # First node of the lowest cost, like np.argmin
+                column = columns[node]
+                best_prev = reached[0]
+                best = row[best_prev] + column[best_prev]
+                for prev in reached:
+                    cost = row[prev] + column[prev]
+                    if cost < best:
+                        best_prev, best = prev, cost
+                best += node_costs[node]
+
+                next_row = dist[mask | group_bit[node]]
+                if best < next_row[node]:
+                    next_row[node] = best
+                    memo[mask | group_bit[node]][node] = best_prev
+
+        return dist, memo, group_bit
+
+    def _build_arrays(self, distance_matrix, groups, node_costs, deadline):
+        """Build the tables with numpy, None if the deadline passed"""
+        import numpy as np
+
+        distance_matrix = np.asarray(distance_matrix, dtype=float)
+        n = distance_matrix.shape[0]
+        node_costs = np.zeros(n) if node_costs is None else np.asarray(node_costs, dtype=float)
+
+        group_bit = np.zeros(n, dtype=np.int64)
+        for g, nodes in enumerate(groups):
+            group_bit[nodes] = 1 << g
+
+        dist = np.full((self.full_mask + 1, n), np.inf)
+        memo = np.zeros((self.full_mask + 1, n), dtype=np.int64)
+
+        grouped = group_bit > 0
+        dist[group_bit[grouped], np.nonzero(grouped)[0]] = (
+            distance_matrix[0, grouped] + node_costs[grouped]
+        )
+
+        # Supersets are always larger than their subsets, so increasing masks are always solved in order
+        for mask in range(1, self.full_mask):
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+
+            row = dist[mask]
+            if np.isinf(row).all():
+                continue
+
+            # Nodes of the groups that are not visited yet
+            nodes = np.nonzero(grouped & ((group_bit & mask) == 0))[0]
+            costs = row[:, None] + distance_matrix[:, nodes]
+            best_prev = np.argmin(costs, axis=0)
+            best = costs[best_prev, np.arange(len(nodes))] + node_costs[nodes]
+
+            next_masks = mask | group_bit[nodes]
+            better = best < dist[next_masks, nodes]
+            dist[next_masks[better], nodes[better]] = best[better]
+            memo[next_masks[better], nodes[better]] = best_prev[better]
+
+        # Solving only reads single entries, which is faster from lists
+        return dist.tolist(), memo.tolist(), group_bit.tolist()
+
+    def solve(self, mask: Optional[int] = None) -> Tuple[List, float]:
+        """Read the optimal path visiting the groups in the mask from the tables
+
+        Parameters
+        ----------
+        mask
+            Bitmask of the groups to visit, bit g standing for groups[g].
+            Defaults to all groups
+
+        Returns
+        -------
+        permutation
+            Node 0 followed by the chosen node of every group in the mask, in
+            visiting order
+
+        distance
+            The total distance (including node costs) the permutation produces.
+            Infinite if some group in the mask cannot be visited
+        """
+        if mask is None:
+            mask = self.full_mask
+        if not mask:
+            return [0], 0.0
+
+        row = self.dist[mask]
+        last = min(range(len(row)), key=row.__getitem__)
+        best_distance = row[last]
+        if math.isinf(best_distance):
+            return [0], best_distance
+
+        # Walk back from the last node to node 0
+        solution = [last]
+        while True:
+            prev = self.memo[mask][solution[-1]]
+            mask ^= self.group_bit[solution[-1]]
+            if not mask:
+                break
+            solution.append(prev)
+        solution.append(0)
+
+        return solution[::-1], best_distance
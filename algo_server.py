@@ -1,58 +1,536 @@
-import socket
-from algo.algo import MazeSolver
-from helper import command_generator
-from consts import Direction
+import argparse
+import asyncio
 import json
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from algo.algo import MazeSolver, get_scale, warm_up
+from algo.cost_model import StepCostModel, estimate_run_time, get_cost_model
+from algo.footprint import find_collisions
+from algo.path_library import PathLibrary
+from helper import command_generator
+from consts import CELL_SIZE, Direction, WIDTH, HEIGHT
+from plan_cache import PlanCache, plan_key
 
 PORT = 50000
 CLIENT_ADDR = "192.168.8.8"
 CLIENT_NAME = f"pi@{CLIENT_ADDR}"
 
-s = socket.socket()
-s.bind(("", PORT))
-s.listen(1)
-
-while True:
-    print("Waiting for client connection...")
-    c, addr = s.accept()
-    if addr[0] != CLIENT_ADDR:
-        print(f"Client addr not equal to {CLIENT_ADDR}: {addr[0]}")
-        c.close()
-        break
-    print("Accepted connection from", addr)
-    content = c.recv(1024).decode()
-    content = json.loads(content)
-
-    label_to_enum = {
-        "N": Direction.NORTH,
-        "S": Direction.SOUTH,
-        "W": Direction.WEST,
-        "E": Direction.EAST,
-    }
-    env_data = content["data"]
+# Number of worker processes planning in parallel, None for one per CPU
+MAX_WORKERS = None
+# Seconds a single plan may take before the request is answered with an error
+PLAN_TIMEOUT = 30
+# Largest request accepted, in bytes
+MAX_MESSAGE_SIZE = 1 << 20
+# Number of plans kept in the plan cache
+PLAN_CACHE_SIZE = 256
+# Seconds between two writes of a persisted plan cache, so that the plans of a burst of requests are written once
+PLAN_CACHE_SAVE_INTERVAL = 5
+
+# Path libraries of the worker process by big_turn, see init_worker
+path_libraries = dict()
+
+label_to_enum = {
+    "N": Direction.NORTH,
+    "S": Direction.SOUTH,
+    "W": Direction.WEST,
+    "E": Direction.EAST,
+}
+
+
+def init_worker(paths):
+    """Open the path libraries and build the shared planner tables, once per worker process
+
+    Args:
+        paths (List[str]): files built by `python -m algo.path_library`
+    """
+    for path in paths:
+        library = PathLibrary(path)
+        path_libraries[library.big_turn] = library
+    # So that the first request of the worker does not pay for them
+    warm_up(WIDTH, HEIGHT, swept_footprint=True)
+
+
+def make_maze_solver(env_data, swept_footprint=True):
+    """Create the MazeSolver of one request
+
+    Args:
+        env_data (dict): {"robot": {x, y, dir}, "obstacles": [{x, y, id, dir}], "big_turn" (optional),
+            "cell_size" (optional, in cm, which the coordinates are in cells of), "cost_model" (optional, "time" to
+            minimise the execution time instead of the grid steps, see COST_MODELS), ...}
+        swept_footprint (bool): whether to drop the moves whose swept robot footprint hits an obstacle. Plans sent to
+            the robot always are, the other plans are only made to compare with, see `find_skipped`
+
+    Raises:
+        ValueError: if the cost model is unknown
+
+    Returns:
+        Tuple[MazeSolver, List[dict]]: the solver, and the obstacles in the format of `command_generator`
+    """
     robot_info = env_data["robot"]
     robot_x = robot_info["x"]
     robot_y = robot_info["y"]
     robot_direction = label_to_enum[robot_info["dir"]]
     # Initialize MazeSolver object with robot size of 20x20, bottom left corner of robot at (1,1), facing north, and whether to use a big turn or not.
-    maze_solver = MazeSolver(20, 20, robot_x, robot_y, robot_direction, big_turn=None)
+    # Finer cells split the same arena into more cells
+    big_turn = int(env_data.get("big_turn") or 0)
+    cell_size = env_data.get("cell_size") or CELL_SIZE
+    scale = get_scale(cell_size)
+    cost_model = get_cost_model(env_data.get("cost_model"))
+    library = path_libraries.get(big_turn)
+    if library is not None and (
+        (library.size_x, library.size_y, library.scale) != (WIDTH * scale, HEIGHT * scale, scale)
+        or not isinstance(cost_model, StepCostModel)
+    ):
+        library = None
+    maze_solver = MazeSolver(
+        WIDTH * scale,
+        HEIGHT * scale,
+        robot_x,
+        robot_y,
+        robot_direction,
+        big_turn=big_turn,
+        path_library=library,
+        cell_size=cell_size,
+        cost_model=cost_model,
+        # The planner only checks where each move ends, so the moves whose swept footprint hits an obstacle are
+        # dropped as well. Checking plans afterwards instead would plan about half of the requests twice
+        swept_footprint=swept_footprint,
+    )
 
     obstacles = env_data["obstacles"]
     obstacle_info = []
     for ob in obstacles:
-        print(1)
         maze_solver.add_obstacle(ob["x"], ob["y"], label_to_enum[ob["dir"]], ob["id"])
         obstacle_info.append(
             {"x": ob["x"], "y": ob["y"], "id": ob["id"], "d": label_to_enum[ob["dir"]]}
         )
 
-    optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=False)
+    return maze_solver, obstacle_info
+
+
+def find_unsafe_moves(maze_solver, path, obstacle_info):
+    """Returns the indices of the states of a path whose move sweeps the robot footprint over an obstacle
+
+    Args:
+        maze_solver (MazeSolver): the solver of the request, see `make_maze_solver`
+        path (List[CellState]): path planned by the solver
+        obstacle_info (List[dict]): the obstacles in the format of `command_generator`
+
+    Returns:
+        List[int]: see `find_collisions`
+    """
+    grid = maze_solver.grid
+    return find_collisions(
+        path, [(ob["x"], ob["y"]) for ob in obstacle_info], grid.size_x, grid.size_y, maze_solver.scale
+    )
+
+
+def find_skipped(env_data, obstacle_info, visited):
+    """Returns the obstacles that a plan does not take a picture of, and those of them skipped for the swept footprint
+
+    The planner drops the obstacles it cannot visit. With the swept footprint, these include the obstacles that can
+    only be visited by sweeping the robot over another obstacle. To tell them apart, the arena is planned again
+    without the swept footprint, only when obstacles are skipped. The skipped obstacles that this second plan visits
+    are the ones that the robot could only picture by hitting an obstacle.
+
+    Args:
+        env_data (dict): see `plan`
+        obstacle_info (List[dict]): the obstacles in the format of `command_generator`
+        visited (Set[int]): ids of the obstacles pictured by the plan
+
+    Returns:
+        Tuple[List[int], List[int]]: the ids of the skipped obstacles, and of those of them that are only skipped
+            because every way to picture them hits an obstacle
+    """
+    skipped = sorted(ob["id"] for ob in obstacle_info if ob["id"] not in visited)
+    if not skipped:
+        return [], []
+
+    point_solver, _ = make_maze_solver(env_data, swept_footprint=False)
+    point_path, _, _ = point_solver.get_optimal_order(
+        retrying=env_data.get("retrying", False), time_budget_ms=env_data.get("time_budget_ms")
+    )
+    point_visited = {state.screenshot_id for state in point_path}
+    return skipped, [ob_id for ob_id in skipped if ob_id in point_visited]
+
+
+def plan(env_data):
+    """Plan the path for one request. Runs in a worker process
+
+    Args:
+        env_data (dict): {"robot": {x, y, dir}, "obstacles": [{x, y, id, dir}], "big_turn" (optional), "retrying" (optional),
+            "time_budget_ms" (optional, plan for at most about this long instead of until the order is optimal)}
+
+    Raises:
+        RuntimeError: if the plan hits an obstacle, which only happens if the robot starts on one
+
+    Returns:
+        dict: {"commands", "distance", "path", "optimal", "stats", "run_time_s", "skipped", "skipped_unsafe"}, see
+            PlannerStats for the stats, `estimate_run_time` for the run time and `find_skipped` for the ids of the
+            obstacles that are not pictured
+    """
+    maze_solver, obstacle_info = make_maze_solver(env_data)
+
+    optimal_path, distance, optimal, stats = maze_solver.get_optimal_order(
+        retrying=env_data.get("retrying", False),
+        time_budget_ms=env_data.get("time_budget_ms"),
+        return_stats=True,
+    )
+
+    # Plans are made with the swept footprint, so this only fails if the robot starts on an obstacle
+    if find_unsafe_moves(maze_solver, optimal_path, obstacle_info):
+        raise RuntimeError("No collision-free plan, the robot starts on an obstacle")
+
     # Based on the shortest path, generate commands for the robot
-    commands = command_generator(optimal_path, obstacle_info)
-
-    print(commands)
-    commands_string = ",".join(commands)
-    print(commands_string)
-    c.send(commands_string.encode())
-    c.close()
-    s.close()
+    commands = command_generator(optimal_path, obstacle_info, cell_size=maze_solver.cell_size)
+    skipped, skipped_unsafe = find_skipped(
+        env_data, obstacle_info, {state.screenshot_id for state in optimal_path}
+    )
+
+    return {
+        "commands": commands,
+        "distance": float(distance),
+        "path": [state.get_dict() for state in optimal_path],
+        "optimal": optimal,
+        "stats": stats.as_dict(),
+        "run_time_s": round(estimate_run_time(commands), 2),
+        "skipped": skipped,
+        "skipped_unsafe": skipped_unsafe,
+    }
+
+
+def plan_legs(env_data):
+    """Plan the path for one request, converting it to commands one leg at a time
+
+    The order of the obstacles is decided first, then the path of every leg is expanded and converted on its own.
+    Deciding the order needs the path costs between all view positions, which is almost all of the work, so the
+    first leg is ready at about the same time as the whole plan of `plan`. Streaming only splits up the output.
+
+    Args:
+        env_data (dict): see `plan`, without "time_budget_ms"
+
+    Raises:
+        RuntimeError: if a leg hits an obstacle, which only happens if the robot starts on one
+
+    Yields:
+        dict: {"commands", "path"} of every leg, ending at a view position, then {"commands": ["FIN"], "path": [],
+            "distance", "skipped", "skipped_unsafe"}. Only the first message's path includes the start state, so that
+            the paths add up to the path of `plan`
+    """
+    maze_solver, obstacle_info = make_maze_solver(env_data)
+
+    items, item_indices = maze_solver.get_view_items(env_data.get("retrying", False))
+    cost_np = maze_solver.get_cost_matrix(items)
+    permutation, distance = maze_solver.find_order(items, item_indices, cost_np)
+
+    start = [items[0].get_dict()]
+    for leg in maze_solver.iter_legs(items, permutation):
+        if find_unsafe_moves(maze_solver, leg, obstacle_info):
+            raise RuntimeError("No collision-free plan, the robot starts on an obstacle")
+        yield {
+            "commands": command_generator(leg, obstacle_info, append_fin=False, cell_size=maze_solver.cell_size),
+            "path": start + [state.get_dict() for state in leg[1:]],
+        }
+        start = []
+
+    skipped, skipped_unsafe = find_skipped(
+        env_data, obstacle_info, {items[index].screenshot_id for index in permutation}
+    )
+    yield {
+        "commands": ["FIN"],
+        "path": start,
+        "distance": float(distance),
+        "skipped": skipped,
+        "skipped_unsafe": skipped_unsafe,
+    }
+
+
+def plan_stream(env_data, legs: queue.Queue):
+    """Put every leg of `plan_legs` on the queue as soon as it is ready, then None. Runs in a worker process"""
+    try:
+        for leg in plan_legs(env_data):
+            legs.put(leg)
+    finally:
+        legs.put(None)
+
+
+class AlgoServer:
+    """
+    Long-lived planning server. Every connection can send any number of newline-delimited JSON requests of the form
+    {"id" (optional), "timeout" (optional), "data": {...}}, each answered with one newline-delimited JSON response of
+    the form {"id", "data", "error"}. Requests are planned concurrently in a pool of worker processes, so responses
+    may come back in a different order than the requests; the "id" of the request is echoed back to match them.
+
+    Requests with "stream": true are answered leg by leg instead, with one response {"id", "data", "error", "done"}
+    per leg (see `plan_legs`). The last response has "done": true and the FIN command, or the error. Streaming only
+    splits up the output: the order of the obstacles is decided before the first leg, which is most of the planning,
+    so the first leg does not arrive much earlier than the whole plan of a request that is not streamed.
+
+    Plans that do not picture every obstacle list the ids of the obstacles they skip in "skipped". Those that could be
+    pictured if the robot were allowed to sweep over another obstacle are also in "skipped_unsafe", so that the
+    client can decide whether to move the obstacles or run the plan without those pictures.
+    """
+
+    def __init__(
+        self,
+        port=PORT,
+        client_addr=CLIENT_ADDR,
+        max_workers=MAX_WORKERS,
+        plan_timeout=PLAN_TIMEOUT,
+        plan_cache=None,
+        path_library_files=(),
+    ):
+        """
+        Args:
+            port (int): Port to listen on
+            client_addr (str): Only accept connections from this address, None to accept any client
+            max_workers (int): Number of worker processes, None for one per CPU
+            plan_timeout (float): Default seconds a single plan may take
+            plan_cache (PlanCache): Cache of the plans of previous requests, None for an in-memory cache
+            path_library_files (List[str]): Path libraries every worker opens, see PathLibrary
+        """
+        self.port = port
+        self.client_addr = client_addr
+        self.max_workers = max_workers
+        self.plan_timeout = plan_timeout
+        self.plan_cache = plan_cache if plan_cache is not None else PlanCache(PLAN_CACHE_SIZE)
+        self.path_library_files = list(path_library_files)
+        self.executor = None
+        # Started by the first streamed request, see `get_manager`
+        self.manager = None
+        # Writes the persisted plan cache, one file at a time, so that the event loop never waits for the disk
+        self.cache_writer = None
+
+    async def serve(self):
+        """Start the worker pool and serve clients until cancelled"""
+        # Worker processes import the planner once and are reused for every request
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=init_worker,
+            initargs=(self.path_library_files,),
+        )
+        server = await asyncio.start_server(
+            self.handle_client, port=self.port, limit=MAX_MESSAGE_SIZE
+        )
+        saver = None
+        if self.plan_cache.path is not None:
+            self.cache_writer = ThreadPoolExecutor(max_workers=1)
+            saver = asyncio.create_task(self.save_plan_cache())
+        print(f"Waiting for client connections on port {self.port}...")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            if self.manager is not None and self.manager.done() and not self.manager.cancelled():
+                if self.manager.exception() is None:
+                    self.manager.result().shutdown()
+            if saver is not None:
+                saver.cancel()
+                if self.plan_cache.dirty:
+                    self.cache_writer.submit(self.plan_cache.write, self.plan_cache.snapshot())
+                self.cache_writer.shutdown()
+
+    async def get_manager(self):
+        """Returns the manager whose queues send the streamed legs back from the workers, starting it on first use"""
+        if self.manager is None:
+            # Starting the manager process blocks, so it is started in a thread. Streams waiting for it share the start
+            self.manager = asyncio.get_running_loop().run_in_executor(None, multiprocessing.Manager)
+        return await self.manager
+
+    async def save_plan_cache(self):
+        """Write the plans cached since the last write to the cache file every PLAN_CACHE_SAVE_INTERVAL seconds"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(PLAN_CACHE_SAVE_INTERVAL)
+            if self.plan_cache.dirty:
+                # The snapshot is taken on the event loop, so that requests can keep inserting while it is written
+                await loop.run_in_executor(self.cache_writer, self.plan_cache.write, self.plan_cache.snapshot())
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info("peername")
+        if self.client_addr is not None and addr[0] != self.client_addr:
+            print(f"Client addr not equal to {self.client_addr}: {addr[0]}")
+            writer.close()
+            await writer.wait_closed()
+            return
+
+        print("Accepted connection from", addr)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The request is larger than MAX_MESSAGE_SIZE, the stream cannot be resynchronised
+                    await self.send(writer, {"id": None, "data": None, "error": "Request too large"})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                task = asyncio.create_task(self.handle_request(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            # Answer the requests that are still being planned before closing
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError as e:
+            print(f"Connection from {addr} lost: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            print("Closed connection from", addr)
+
+    async def handle_request(self, line: bytes, writer: asyncio.StreamWriter):
+        request_id = None
+        stream = False
+        try:
+            content = json.loads(line)
+            request_id = content.get("id")
+            timeout = content.get("timeout", self.plan_timeout)
+            stream = bool(content.get("stream"))
+            if stream:
+                await self.handle_stream(content, writer)
+                return
+
+            # Identical arenas are answered from the cache without planning again
+            key = plan_key(content["data"])
+            result = self.plan_cache.get(key)
+            if result is None:
+                loop = asyncio.get_running_loop()
+                # The worker keeps running a timed out plan to completion, but its result is discarded
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, plan, content["data"]), timeout
+                )
+                # Plans cut short by their time budget may be improved on by the next request
+                if result["optimal"]:
+                    self.plan_cache.put(key, result)
+            else:
+                print(f"Plan cache hit: {self.plan_cache.stats()}")
+            response = {"id": request_id, "data": result, "error": None}
+        except asyncio.TimeoutError:
+            response = {"id": request_id, "data": None, "error": f"Planning timed out after {timeout}s"}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            response = {"id": request_id, "data": None, "error": f"Invalid request: {e!r}"}
+        except Exception as e:
+            response = {"id": request_id, "data": None, "error": f"Planning failed: {e!r}"}
+
+        print(response["error"] or response["data"]["commands"])
+        if response["data"] and response["data"]["skipped_unsafe"]:
+            print(f"Skipped obstacles {response['data']['skipped_unsafe']}, every path to them hits an obstacle")
+        if stream:
+            response["done"] = True
+        await self.send(writer, response)
+
+    async def handle_stream(self, content: dict, writer: asyncio.StreamWriter):
+        request_id = content.get("id")
+        timeout = content.get("timeout", self.plan_timeout)
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+
+        # Streamed plans are cached without the stats and run time of `plan`, so they are cached under their own key.
+        # The plans of `plan` are the same plans, so they can be streamed too
+        key = plan_key(content["data"], stream=True)
+        cached = self.plan_cache.get(key) or self.plan_cache.get(plan_key(content["data"]))
+        if cached is not None:
+            # The whole plan is ready, send it as a single leg
+            legs = [
+                {"commands": cached["commands"][:-1], "path": cached["path"]},
+                {
+                    "commands": ["FIN"],
+                    "path": [],
+                    "distance": cached["distance"],
+                    "skipped": cached["skipped"],
+                    "skipped_unsafe": cached["skipped_unsafe"],
+                },
+            ]
+            for leg in legs:
+                await self.send(writer, {"id": request_id, "data": leg, "error": None, "done": "distance" in leg})
+            return
+
+        legs = (await self.get_manager()).Queue()
+        future = loop.run_in_executor(self.executor, plan_stream, content["data"], legs)
+        commands, path = [], []
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                # Wait for the next leg in a thread, as the queue is blocking
+                leg = await loop.run_in_executor(None, legs.get, True, remaining)
+                if leg is None:
+                    # The worker is done, re-raising its error if it failed
+                    await future
+                    break
+
+                done = "distance" in leg
+                await self.send(writer, {"id": request_id, "data": leg, "error": None, "done": done})
+                commands.extend(leg["commands"])
+                path.extend(leg["path"])
+                if done:
+                    self.plan_cache.put(
+                        key,
+                        {
+                            "commands": commands,
+                            "distance": leg["distance"],
+                            "path": path,
+                            "optimal": True,
+                            "stats": None,
+                            "skipped": leg["skipped"],
+                            "skipped_unsafe": leg["skipped_unsafe"],
+                        },
+                    )
+                    if leg["skipped_unsafe"]:
+                        print(f"Skipped obstacles {leg['skipped_unsafe']}, every path to them hits an obstacle")
+            print(commands)
+        except (asyncio.TimeoutError, queue.Empty):
+            await self.send(
+                writer, {"id": request_id, "data": None, "error": f"Planning timed out after {timeout}s", "done": True}
+            )
+        except Exception as e:
+            await self.send(writer, {"id": request_id, "data": None, "error": f"Planning failed: {e!r}", "done": True})
+
+    @staticmethod
+    async def send(writer: asyncio.StreamWriter, response: dict):
+        writer.write((json.dumps(response) + "\n").encode())
+        await writer.drain()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MDP algorithm server")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--client-addr",
+        default=CLIENT_ADDR,
+        help="only accept connections from this address, empty to accept any client",
+    )
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--timeout", type=float, default=PLAN_TIMEOUT)
+    parser.add_argument("--cache-size", type=int, default=PLAN_CACHE_SIZE)
+    parser.add_argument("--cache-file", help="persist the plan cache to this JSON file")
+    parser.add_argument(
+        "--path-library",
+        action="append",
+        default=[],
+        help="path library built by `python -m algo.path_library`, once per turning mode",
+    )
+    args = parser.parse_args()
+
+    algo_server = AlgoServer(
+        port=args.port,
+        client_addr=args.client_addr or None,
+        max_workers=args.workers,
+        plan_timeout=args.timeout,
+        plan_cache=PlanCache(args.cache_size, args.cache_file),
+        path_library_files=args.path_library,
+    )
+    try:
+        asyncio.run(algo_server.serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,272 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from algo.batch import BatchStats, make_solver, plan_batch
+from helper import command_generator
+from consts import Direction, WIDTH, HEIGHT
+
+# Stages of a plan, timed separately
+STAGES = ["view_positions", "path_costs", "tsp", "commands", "total"]
+PERCENTILES = [50, 90, 99]
+
+# Area around the robot's starting position that is kept free of obstacles
+START_ZONE = 4
+
+
+def random_arena(rng: random.Random, n_obstacles: int, clutter: float = 0.5, big_turn=0, retrying=False):
+    """Generate a valid random arena
+
+    Inputs
+    ------
+    rng: random number generator, seeded by the caller for reproducible arenas
+    n_obstacles: number of obstacles to place
+    clutter: between 0 and 1, how close obstacles may be to each other. At 0 obstacles are at least 4 cells apart
+        (in both x and y), at 1 they only need to be on different cells
+    big_turn: 0 for 3-1 turns, 1 for 4-2 turns
+    retrying: whether the robot is retrying to view the obstacles from further away
+
+    Returns
+    -------
+    arena: {"robot": {x, y, d}, "obstacles": [{x, y, id, d}], "big_turn", "retrying"}
+    """
+    min_gap = max(1, round(4 - 3 * clutter))
+    obstacles = []
+    attempts = 0
+    while len(obstacles) < n_obstacles:
+        attempts += 1
+        if attempts > 10000:
+            raise ValueError(f"Cannot place {n_obstacles} obstacles with clutter {clutter}")
+
+        x = rng.randrange(WIDTH)
+        y = rng.randrange(HEIGHT)
+        # Keep the robot's starting position free
+        if x < START_ZONE and y < START_ZONE:
+            continue
+        if any(max(abs(ob["x"] - x), abs(ob["y"] - y)) < min_gap for ob in obstacles):
+            continue
+
+        d = rng.choice([Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST])
+        obstacles.append({"x": x, "y": y, "id": len(obstacles) + 1, "d": int(d)})
+
+    return {
+        "robot": {"x": 1, "y": 1, "d": int(Direction.NORTH)},
+        "obstacles": obstacles,
+        "big_turn": big_turn,
+        "retrying": retrying,
+    }
+
+
+def random_arenas(seed: int, count: int, min_obstacles=1, max_obstacles=12):
+    """Generate `count` random arenas, varying the number of obstacles, clutter, turns and retrying
+
+    Returns
+    -------
+    arenas: list of arenas, see `random_arena`
+    """
+    rng = random.Random(seed)
+    return [
+        random_arena(
+            rng,
+            rng.randint(min_obstacles, max_obstacles),
+            clutter=rng.random(),
+            big_turn=rng.randrange(2),
+            retrying=rng.random() < 0.5,
+        )
+        for _ in range(count)
+    ]
+
+
+def time_plan(arena):
+    """Plan the arena from scratch, timing every stage
+
+    Returns
+    -------
+    timings: seconds spent in each stage
+    distance: distance of the plan
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    maze_solver = make_solver(arena)
+
+    stage_start = time.perf_counter()
+    items, item_indices = maze_solver.get_view_items(arena["retrying"])
+    timings["view_positions"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    cost_np = maze_solver.get_cost_matrix(items)
+    timings["path_costs"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    optimal_path, distance = maze_solver.solve_order(items, item_indices, cost_np)
+    timings["tsp"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    command_generator(optimal_path, arena["obstacles"])
+    timings["commands"] = time.perf_counter() - stage_start
+
+    timings["total"] = time.perf_counter() - start
+    return timings, float(distance)
+
+
+def peak_memory(arena):
+    """Peak memory allocated while planning the arena from a cold start, in bytes
+
+    The arena is planned in a new process, as the tables that the planner caches at module level (successors, view
+    offsets, swept footprints, heuristics) would otherwise already be built by the timed plans and not be counted
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(measure_peak_memory, arena).result()
+
+
+def measure_peak_memory(arena):
+    """Peak memory allocated while planning the arena in this process, in bytes, see `peak_memory`"""
+    tracemalloc.start()
+    try:
+        maze_solver = make_solver(arena)
+        optimal_path, _ = maze_solver.get_optimal_order_dp(arena["retrying"])
+        command_generator(optimal_path, arena["obstacles"])
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values, p):
+    """p-th percentile of the values, interpolating between the closest ranks"""
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarise(values):
+    """Summary statistics of a list of timings in seconds, reported in milliseconds"""
+    summary = {"mean": sum(values) / len(values) * 1000, "max": max(values) * 1000}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = percentile(values, p) * 1000
+    return {k: round(v, 3) for k, v in summary.items()}
+
+
+def run_batch(arenas, workers=None):
+    """Plan the arenas in parallel with `plan_batch`
+
+    Returns
+    -------
+    stats: aggregate throughput of the batch, see `BatchStats`
+    """
+    stats = BatchStats()
+    for _ in plan_batch(arenas, workers, stats):
+        pass
+    return stats.as_dict()
+
+
+def run_benchmark(seed=0, count=50, repeat=3, min_obstacles=1, max_obstacles=12, memory=True, workers=0):
+    """Plan `count` random arenas `repeat` times each and summarise the timings.
+    If `workers` is not 0, also plan them once with `plan_batch` (None for one worker per CPU) to measure throughput
+
+    Returns
+    -------
+    report: JSON-serialisable report of the configuration, stage timings, distances and peak memory
+    """
+    arenas = random_arenas(seed, count, min_obstacles, max_obstacles)
+
+    timings = {stage: [] for stage in STAGES}
+    by_obstacles = {}
+    distances = []
+    for arena in arenas:
+        for _ in range(repeat):
+            arena_timings, distance = time_plan(arena)
+            for stage in STAGES:
+                timings[stage].append(arena_timings[stage])
+            by_obstacles.setdefault(len(arena["obstacles"]), []).append(arena_timings["total"])
+        distances.append(distance)
+
+    report = {
+        "config": {
+            "seed": seed,
+            "count": count,
+            "repeat": repeat,
+            "min_obstacles": min_obstacles,
+            "max_obstacles": max_obstacles,
+        },
+        "stages_ms": {stage: summarise(timings[stage]) for stage in STAGES},
+        "total_ms_by_obstacles": {
+            str(n): summarise(values) for n, values in sorted(by_obstacles.items())
+        },
+        # Distances only change if the plans themselves change
+        "distances": distances,
+    }
+
+    if memory:
+        peaks = [peak_memory(arena) for arena in arenas]
+        report["peak_memory_kb"] = {
+            "max": round(max(peaks) / 1024, 1),
+            "p50": round(percentile(peaks, 50) / 1024, 1),
+        }
+
+    if workers != 0:
+        report["batch"] = run_batch(arenas, workers)
+
+    return report
+
+
+def compare(old, new):
+    """Print the relative change of every stage's timings and of the distances between two reports"""
+    for stage in STAGES:
+        old_stage = old["stages_ms"].get(stage)
+        new_stage = new["stages_ms"][stage]
+        if old_stage is None:
+            continue
+        changes = ", ".join(
+            f"{k} {old_stage[k]:.3f} -> {new_stage[k]:.3f} ({(new_stage[k] - old_stage[k]) / old_stage[k] * 100 if old_stage[k] else 0:+.1f}%)"
+            for k in ("p50", "p90", "max")
+        )
+        print(f"{stage:>15}: {changes}")
+
+    if old["config"] != new["config"]:
+        print("Configurations differ, distances are not comparable")
+        return
+    changed = sum(a != b for a, b in zip(old["distances"], new["distances"]))
+    improved = sum(b < a for a, b in zip(old["distances"], new["distances"]))
+    print(f"Distances: {changed} of {len(new['distances'])} changed, {improved} improved")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the planner on reproducible random arenas")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--arenas", type=int, default=50, help="number of random arenas")
+    parser.add_argument("--repeat", type=int, default=3, help="number of times every arena is planned")
+    parser.add_argument("--min-obstacles", type=int, default=1)
+    parser.add_argument("--max-obstacles", type=int, default=12)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the tracemalloc pass, which plans every arena again in a new process"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0, help="also measure batch throughput with this many workers, -1 for one per CPU"
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        seed=args.seed,
+        count=args.arenas,
+        repeat=args.repeat,
+        min_obstacles=args.min_obstacles,
+        max_obstacles=args.max_obstacles,
+        memory=not args.no_memory,
+        workers=None if args.workers < 0 else args.workers,
+    )
+
+    print(json.dumps({k: v for k, v in report.items() if k != "distances"}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,120 @@
+import argparse
+import hashlib
+import json
+import sys
+from algo.batch import make_solver
+from algo.cost_model import get_cost_model
+from benchmark import random_arenas
+
+# Costs of the planner on reproducible random arenas, which optimisations must leave unchanged
+BASELINE_FILE = "checkalgo_baseline.json"
+# Search methods of `MazeSolver.path_cost_generator`, which must all produce the same path costs
+METHODS = ["dijkstra", "astar", "bidirectional"]
+
+
+def path_costs(arena, items, method):
+    """Path costs between the view positions of the arena, found with one search method
+
+    Inputs
+    ------
+    arena: see `benchmark.random_arena`
+    items: states from `MazeSolver.get_view_items`
+    method: see `MazeSolver.path_cost_generator`
+
+    Returns
+    -------
+    costs: cost of every (start, end) pair of items with start before end, 1e9 if there is no path
+    """
+    # A new solver for every method, as the solver reuses the paths it already found
+    maze_solver = make_solver(arena)
+    maze_solver.path_cost_generator(items, method)
+    return [
+        float(maze_solver.cost_table.get((items[s], items[e]), 1e9))
+        for s in range(len(items) - 1)
+        for e in range(s + 1, len(items))
+    ]
+
+
+def arena_costs(arena):
+    """Costs of planning the arena that must not change
+
+    Inputs
+    ------
+    arena: see `benchmark.random_arena`
+
+    Raises
+    ------
+    ValueError: if the search methods do not produce the same path costs
+
+    Returns
+    -------
+    costs: {"distance", "time_distance", "swept_distance", "path_costs"}, the distances of the optimal plans with the
+        step cost model, the execution time cost model and the swept footprint, and the sha256 of the path costs
+        between the view positions
+    """
+    items, _ = make_solver(arena).get_view_items(arena["retrying"])
+    tables = {method: path_costs(arena, items, method) for method in METHODS}
+    for method in METHODS[1:]:
+        if tables[method] != tables[METHODS[0]]:
+            raise ValueError(f"{method} path costs differ from {METHODS[0]}")
+
+    _, distance = make_solver(arena).get_optimal_order_dp(arena["retrying"])
+    _, time_distance = make_solver(arena, cost_model=get_cost_model("time")).get_optimal_order_dp(arena["retrying"])
+    _, swept_distance = make_solver(arena, swept_footprint=True).get_optimal_order_dp(arena["retrying"])
+    return {
+        "distance": float(distance),
+        "time_distance": float(time_distance),
+        "swept_distance": float(swept_distance),
+        "path_costs": hashlib.sha256(json.dumps(tables[METHODS[0]]).encode()).hexdigest(),
+    }
+
+
+def run_check(seed=0, count=60, min_obstacles=1, max_obstacles=10):
+    """Compute the costs of `count` random arenas, see `arena_costs`
+
+    Returns
+    -------
+    report: {"config", "costs"}, the costs of every arena in order
+    """
+    arenas = random_arenas(seed, count, min_obstacles, max_obstacles)
+    return {
+        "config": {"seed": seed, "count": count, "min_obstacles": min_obstacles, "max_obstacles": max_obstacles},
+        "costs": [arena_costs(arena) for arena in arenas],
+    }
+
+
+def compare(baseline, report):
+    """Print every cost of the report that differs from the baseline
+
+    Returns
+    -------
+    mismatches: number of costs that differ
+    """
+    mismatches = 0
+    for index, (old, new) in enumerate(zip(baseline["costs"], report["costs"])):
+        for name, value in new.items():
+            if old.get(name) != value:
+                mismatches += 1
+                print(f"Arena {index}: {name} {old.get(name)} -> {value}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the costs of the planner against a stored baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update", action="store_true", help="rewrite the baseline after an intended change of costs")
+    args = parser.parse_args()
+
+    if args.update:
+        report = run_check()
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote the costs of {len(report['costs'])} arenas to {args.baseline}")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    report = run_check(**baseline["config"])
+    mismatches = compare(baseline, report)
+    print(f"{mismatches} of {len(report['costs']) * len(report['costs'][0])} costs differ from {args.baseline}")
+    sys.exit(1 if mismatches else 0)
@@ -30,8 +30,36 @@ EXPANDED_CELL = 1 # for both agent and obstacles
 WIDTH = 20
 HEIGHT = 20
 
-ITERATIONS = 2000
+# Size of a cell of the WIDTH x HEIGHT grid, in cm. Finer grids split every cell into scale x scale cells, see
+# MazeSolver, and every distance below is in cells of this size
+CELL_SIZE = 10
+
+# Start position of the robot and size of an obstacle, in cells
+ROBOT_X = 1
+ROBOT_Y = 1
+OBS_DIM = 1
+ROBOT_DIM = 3
+
 TURN_RADIUS = 1
 
 SAFE_COST = 1000 # the cost for the turn in case there is a chance that the robot is touch some obstacle
-SCREENSHOT_COST = 50 # the cost for the place where the picture is taken
\ No newline at end of file
+SCREENSHOT_COST = 50 # the cost for the place where the picture is taken
+
+# Displacements of the robot when it turns from one direction to another, in units of the bigger and smaller change
+# of the turn (3-1 or 4-2). Each entry is ((x_big, x_small), (y_big, y_small)), so that the robot moves by
+# x_big * bigger + x_small * smaller along x and y_big * bigger + y_small * smaller along y.
+# The first displacement of every pair is the forward turn and the second is the backward turn.
+TURN_DISPLACEMENTS = {
+    # north <-> east
+    (Direction.NORTH, Direction.EAST): [((1, 0), (0, 1)), ((0, -1), (-1, 0))],
+    (Direction.EAST, Direction.NORTH): [((0, 1), (1, 0)), ((-1, 0), (0, -1))],
+    # east <-> south
+    (Direction.EAST, Direction.SOUTH): [((0, 1), (-1, 0)), ((-1, 0), (0, 1))],
+    (Direction.SOUTH, Direction.EAST): [((1, 0), (0, -1)), ((0, -1), (1, 0))],
+    # south <-> west
+    (Direction.SOUTH, Direction.WEST): [((-1, 0), (0, -1)), ((0, 1), (1, 0))],
+    (Direction.WEST, Direction.SOUTH): [((0, -1), (-1, 0)), ((1, 0), (0, 1))],
+    # west <-> north
+    (Direction.WEST, Direction.NORTH): [((0, -1), (1, 0)), ((1, 0), (0, -1))],
+    (Direction.NORTH, Direction.WEST): [((0, 1), (-1, 0)), ((-1, 0), (0, 1))],
+}
@@ -1,10 +1,21 @@
 from typing import List
-from consts import Direction, EXPANDED_CELL, SCREENSHOT_COST
+from consts import Direction, EXPANDED_CELL, SCREENSHOT_COST, SAFE_COST, WIDTH, HEIGHT
 from helper import is_valid
 
+# Layers of the clearance raster held by Grid, one per rule used by Grid.reachable
+CLEARANCE_PLAIN = 0
+CLEARANCE_TURN = 1
+CLEARANCE_PRE_TURN = 2
+
 
 class CellState:
-    """Base class for all objects on the arena, such as cells, obstacles, etc"""
+    """Base class for all objects on the arena, such as cells, obstacles, etc
+
+    Cell states are compared and hashed by value on (x, y, direction), so that equal states share the entries of
+    the path and cost tables regardless of which object was used to create them.
+    """
+
+    __slots__ = ("x", "y", "direction", "screenshot_id", "penalty")
 
     def __init__(self, x, y, direction: Direction = Direction.NORTH, screenshot_id=-1, penalty=0):
         self.x = x
@@ -39,6 +50,22 @@ class CellState:
         """
         return self.x == x and self.y == y and self.direction == direction
 
+    def __eq__(self, other):
+        """Checks if this cell state is the same as input in terms of x, y, and direction
+
+        Args:
+            other (CellState): input cell state to compare to
+
+        Returns:
+            bool: True if same, False otherwise
+        """
+        if not isinstance(other, CellState):
+            return NotImplemented
+        return self.x == other.x and self.y == other.y and self.direction == other.direction
+
+    def __hash__(self):
+        return hash((self.x, self.y, self.direction))
+
     def __repr__(self):
         return "x: {}, y: {}, d: {}, screenshot: {}".format(self.x, self.y, self.direction, self.screenshot_id)
 
@@ -60,240 +87,115 @@ class CellState:
 
 
 class Obstacle(CellState):
-    """Obstacle class, inherited from CellState"""
+    """Obstacle class, inherited from CellState. Obstacles are the same if they have the same x, y, and direction"""
+
+    __slots__ = ("obstacle_id",)
 
     def __init__(self, x: int, y: int, direction: Direction, obstacle_id: int):
         super().__init__(x, y, direction)
         self.obstacle_id = obstacle_id
 
-    def __eq__(self, other):
-        """Checks if this obstacle is the same as input in terms of x, y, and direction
+    def get_view_state(self, retrying, size_x=WIDTH, size_y=HEIGHT, scale=1) -> List[CellState]:
+        """Constructs the list of CellStates from which the robot can view the symbol on the obstacle, see VIEW_TEMPLATES
 
         Args:
-            other (Obstacle): input obstacle to compare to
-
-        Returns:
-            bool: True if same, False otherwise
-        """
-        return self.x == other.x and self.y == other.y and self.direction == other.direction
-
-    def get_view_state(self, retrying) -> List[CellState]:
-        """Constructs the list of CellStates from which the robot can view the symbol on the obstacle
+            retrying (bool): whether the robot is retrying to view the obstacles from further away
+            size_x (int, optional): Size of the grid in the x direction. Defaults to WIDTH.
+            size_y (int, optional): Size of the grid in the y direction. Defaults to HEIGHT.
+            scale (int, optional): Number of cells of the grid per cell of CELL_SIZE. Defaults to 1.
 
         Returns:
             List[CellState]: Valid cell states where robot can be positioned to view the symbol on the obstacle
         """
         cells = []
+        for dx, dy, robot_direction, penalty in get_view_offsets(self.direction, retrying, scale):
+            if is_valid(self.x + dx, self.y + dy, size_x, size_y, scale):
+                cells.append(CellState(self.x + dx, self.y + dy, robot_direction, self.obstacle_id, penalty))
+        return cells
 
-        # If the obstacle is facing north, then robot's cell state must be facing south
-        if self.direction == Direction.NORTH:
-            if retrying == False:
-                # Or (x, y + 3)
-                if is_valid(self.x, self.y + 1 + EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y + 1 + EXPANDED_CELL * 2, Direction.SOUTH, self.obstacle_id, 5))
-                # Or (x, y + 4)
-                if is_valid(self.x, self.y + 2 + EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y + 2 + EXPANDED_CELL * 2, Direction.SOUTH, self.obstacle_id, 0))
-
-                # Or (x + 1, y + 3)
-                # if is_valid(self.x + 1, self.y + 1 + EXPANDED_CELL * 2):
-                #     cells.append(CellState(self.x + 1, self.y + 1 + EXPANDED_CELL * 2, Direction.SOUTH, self.obstacle_id, SCREENSHOT_COST*10))
-                # # Or (x - 1, y + 3)
-                # if is_valid(self.x - 1, self.y + 1 + EXPANDED_CELL * 2):
-                #     cells.append(CellState(self.x - 1, self.y + 1 + EXPANDED_CELL * 2, Direction.SOUTH, self.obstacle_id, SCREENSHOT_COST*10))
-
-                # Or (x + 1, y + 4)
-                if is_valid(self.x + 1, self.y + 2 + EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x + 1, self.y + 2 + EXPANDED_CELL *
-                                 2, Direction.SOUTH, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x - 1, y + 4)
-                if is_valid(self.x - 1, self.y + 2 + EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x - 1, self.y + 2 + EXPANDED_CELL *
-                                 2, Direction.SOUTH, self.obstacle_id, SCREENSHOT_COST))
-
-            elif retrying == True:
-                # Or (x, y + 4)
-                if is_valid(self.x, self.y + 2 + EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y + 2 + EXPANDED_CELL * 2, Direction.SOUTH, self.obstacle_id, 0))
-                # Or (x, y + 5)
-                if is_valid(self.x, self.y + 3 + EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y + 3 + EXPANDED_CELL * 2, Direction.SOUTH, self.obstacle_id, 0))
-                # Or (x + 1, y + 4)
-                if is_valid(self.x + 1, self.y + 2 + EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x + 1, self.y + 2 + EXPANDED_CELL *
-                                 2, Direction.SOUTH, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x - 1, y + 4)
-                if is_valid(self.x - 1, self.y + 2 + EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x - 1, self.y + 2 + EXPANDED_CELL *
-                                 2, Direction.SOUTH, self.obstacle_id, SCREENSHOT_COST))
-
-        # If obstacle is facing south, then robot's cell state must be facing north
-        elif self.direction == Direction.SOUTH:
-
-            if retrying == False:
-                # Or (x, y - 3)
-                if is_valid(self.x, self.y - 1 - EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y - 1 - EXPANDED_CELL * 2, Direction.NORTH, self.obstacle_id, 5))
-                # Or (x, y - 4)
-                if is_valid(self.x, self.y - 2 - EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y - 2 - EXPANDED_CELL * 2, Direction.NORTH, self.obstacle_id, 0))
-
-                # Or (x + 1, y - 3)
-                # if is_valid(self.x + 1, self.y - 1 - EXPANDED_CELL * 2):
-                #     cells.append(CellState(self.x + 1, self.y - 1 - EXPANDED_CELL * 2, Direction.NORTH, self.obstacle_id, SCREENSHOT_COST*10))
-                # # Or (x - 1, y - 3)
-                # if is_valid(self.x - 1, self.y - 1 - EXPANDED_CELL * 2):
-                #     cells.append(CellState(self.x - 1, self.y - 1 - EXPANDED_CELL * 2, Direction.NORTH, self.obstacle_id, SCREENSHOT_COST*10))
-
-                # Or (x + 1, y - 4)
-                if is_valid(self.x + 1, self.y - 2 - EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x + 1, self.y - 2 - EXPANDED_CELL *
-                                 2, Direction.NORTH, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x - 1, y - 4)
-                if is_valid(self.x - 1, self.y - 2 - EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x - 1, self.y - 2 - EXPANDED_CELL *
-                                 2, Direction.NORTH, self.obstacle_id, SCREENSHOT_COST))
-
-            elif retrying == True:
-                # Or (x, y - 4)
-                if is_valid(self.x, self.y - 2 - EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y - 2 - EXPANDED_CELL * 2, Direction.NORTH, self.obstacle_id, 0))
-                # Or (x, y - 5)
-                if is_valid(self.x, self.y - 3 - EXPANDED_CELL * 2):
-                    cells.append(CellState(
-                        self.x, self.y - 3 - EXPANDED_CELL * 2, Direction.NORTH, self.obstacle_id, 0))
-                # Or (x + 1, y - 4)
-                if is_valid(self.x + 1, self.y - 2 - EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x + 1, self.y - 2 - EXPANDED_CELL *
-                                 2, Direction.NORTH, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x - 1, y - 4)
-                if is_valid(self.x - 1, self.y - 2 - EXPANDED_CELL * 2):
-                    cells.append(CellState(self.x - 1, self.y - 2 - EXPANDED_CELL *
-                                 2, Direction.NORTH, self.obstacle_id, SCREENSHOT_COST))
-
-        # If obstacle is facing east, then robot's cell state must be facing west
-        elif self.direction == Direction.EAST:
-
-            if retrying == False:
-                # Or (x + 3,y)
-                if is_valid(self.x + 1 + EXPANDED_CELL * 2, self.y):
-                    cells.append(CellState(self.x + 1 + EXPANDED_CELL * 2,
-                                 self.y, Direction.WEST, self.obstacle_id, 5))
-                # Or (x + 4,y)
-                if is_valid(self.x + 2 + EXPANDED_CELL * 2, self.y):
-                    # print(f"Obstacle facing east, Adding {self.x + 2 + EXPANDED_CELL * 2}, {self.y}")
-                    cells.append(CellState(self.x + 2 + EXPANDED_CELL * 2,
-                                 self.y, Direction.WEST, self.obstacle_id, 0))
-
-                # Or (x + 3,y + 1)
-                # if is_valid(self.x + 1 + EXPANDED_CELL * 2, self.y + 1):
-                #     #print(f"Obstacle facing east, Adding {self.x + 2 + EXPANDED_CELL * 2}, {self.y + 1}")
-                #     cells.append(CellState(self.x + 1 + EXPANDED_CELL * 2, self.y + 1, Direction.WEST, self.obstacle_id, SCREENSHOT_COST*10))
-                # # Or (x + 3,y - 1)
-                # if is_valid(self.x + 1 + EXPANDED_CELL * 2, self.y - 1):
-                #     #print(f"Obstacle facing east, Adding {self.x + 2 + EXPANDED_CELL * 2}, {self.y - 1}")
-                #     cells.append(CellState(self.x + 1 + EXPANDED_CELL * 2, self.y - 1, Direction.WEST, self.obstacle_id, SCREENSHOT_COST*10))
-
-                # Or (x + 4, y + 1)
-                if is_valid(self.x + 2 + EXPANDED_CELL * 2, self.y + 1):
-                    cells.append(CellState(self.x + 2 + EXPANDED_CELL * 2, self.y +
-                                 1, Direction.WEST, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x + 4, y - 1)
-                if is_valid(self.x + 2 + EXPANDED_CELL * 2, self.y - 1):
-                    cells.append(CellState(self.x + 2 + EXPANDED_CELL * 2, self.y -
-                                 1, Direction.WEST, self.obstacle_id, SCREENSHOT_COST))
-
-            elif retrying == True:
-                # Or (x + 4, y)
-                if is_valid(self.x + 2 + EXPANDED_CELL * 2, self.y):
-                    cells.append(CellState(self.x + 2 + EXPANDED_CELL * 2,
-                                 self.y, Direction.WEST, self.obstacle_id, 0))
-                # Or (x + 5, y)
-                if is_valid(self.x + 3 + EXPANDED_CELL * 2, self.y):
-                    cells.append(CellState(self.x + 3 + EXPANDED_CELL * 2,
-                                 self.y, Direction.WEST, self.obstacle_id, 0))
-                # Or (x + 4,y + 1)
-                if is_valid(self.x + 2 + EXPANDED_CELL * 2, self.y + 1):
-                    cells.append(CellState(self.x + 2 + EXPANDED_CELL * 2, self.y +
-                                 1, Direction.WEST, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x + 4,y - 1)
-                if is_valid(self.x + 2 + EXPANDED_CELL * 2, self.y - 1):
-                    cells.append(CellState(self.x + 2 + EXPANDED_CELL * 2, self.y -
-                                 1, Direction.WEST, self.obstacle_id, SCREENSHOT_COST))
-
-        # If obstacle is facing west, then robot's cell state must be facing east
-        elif self.direction == Direction.WEST:
-            # It can be (x - 2,y)
-            # if is_valid(self.x - EXPANDED_CELL * 2, self.y):
-            #     cells.append(CellState(self.x - EXPANDED_CELL * 2, self.y, Direction.EAST, self.obstacle_id, 0))
-
-            if retrying == False:
-                # Or (x - 3, y)
-                if is_valid(self.x - 1 - EXPANDED_CELL * 2, self.y):
-                    cells.append(CellState(self.x - 1 - EXPANDED_CELL * 2,
-                                 self.y, Direction.EAST, self.obstacle_id, 5))
-                # Or (x - 4, y)
-                if is_valid(self.x - 2 - EXPANDED_CELL * 2, self.y):
-                    cells.append(CellState(self.x - 2 - EXPANDED_CELL * 2,
-                                 self.y, Direction.EAST, self.obstacle_id, 0))
-
-                # Or (x - 3,y + 1)
-                # if is_valid(self.x - 1 - EXPANDED_CELL * 2, self.y + 1):
-                #     cells.append(CellState(self.x - 1 - EXPANDED_CELL * 2, self.y + 1, Direction.EAST, self.obstacle_id, SCREENSHOT_COST*10))
-                # # Or (x - 3,y - 1)
-                # if is_valid(self.x - 1 - EXPANDED_CELL * 2, self.y - 1):
-                #     cells.append(CellState(self.x - 1 - EXPANDED_CELL * 2, self.y - 1, Direction.EAST, self.obstacle_id, SCREENSHOT_COST*10))
-
-                # Or (x - 4, y + 1)
-                if is_valid(self.x - 2 - EXPANDED_CELL * 2, self.y + 1):
-                    cells.append(CellState(self.x - 2 - EXPANDED_CELL * 2, self.y +
-                                 1, Direction.EAST, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x - 4, y - 1)
-                if is_valid(self.x - 2 - EXPANDED_CELL * 2, self.y - 1):
-                    cells.append(CellState(self.x - 2 - EXPANDED_CELL * 2, self.y -
-                                 1, Direction.EAST, self.obstacle_id, SCREENSHOT_COST))
-
-            elif retrying == True:
-                # Or (x - 4, y)
-                if is_valid(self.x - 2 - EXPANDED_CELL * 2, self.y):
-                    cells.append(CellState(self.x - 2 - EXPANDED_CELL * 2,
-                                 self.y, Direction.EAST, self.obstacle_id, 0))
-                # Or (x - 5, y)
-                if is_valid(self.x - 3 - EXPANDED_CELL * 2, self.y):
-                    cells.append(CellState(self.x - 3 - EXPANDED_CELL * 2,
-                                 self.y, Direction.EAST, self.obstacle_id, 0))
-                # Or (x - 4, y + 1)
-                if is_valid(self.x - 2 - EXPANDED_CELL * 2, self.y + 1):
-                    cells.append(CellState(self.x - 2 - EXPANDED_CELL * 2, self.y +
-                                 1, Direction.EAST, self.obstacle_id, SCREENSHOT_COST))
-                # Or (x - 4, y - 1)
-                if is_valid(self.x - 2 - EXPANDED_CELL * 2, self.y - 1):
-                    cells.append(CellState(self.x - 2 - EXPANDED_CELL * 2, self.y -
-                                 1, Direction.EAST, self.obstacle_id, SCREENSHOT_COST))
 
-        return cells
+# Candidate view positions of the robot by retrying, as (distance in front of the obstacle's face, offset along the
+# face, penalty), in cells of CELL_SIZE. New standoff distances are added here
+VIEW_TEMPLATES = {
+    False: [
+        (1 + EXPANDED_CELL * 2, 0, 5),
+        (2 + EXPANDED_CELL * 2, 0, 0),
+        (2 + EXPANDED_CELL * 2, 1, SCREENSHOT_COST),
+        (2 + EXPANDED_CELL * 2, -1, SCREENSHOT_COST),
+    ],
+    # Further away when retrying
+    True: [
+        (2 + EXPANDED_CELL * 2, 0, 0),
+        (3 + EXPANDED_CELL * 2, 0, 0),
+        (2 + EXPANDED_CELL * 2, 1, SCREENSHOT_COST),
+        (2 + EXPANDED_CELL * 2, -1, SCREENSHOT_COST),
+    ],
+}
+
+# Frame of the templates by the direction the obstacle faces: (x, y) of a step in front of the face, (x, y) of a
+# step along the face, and the direction of the robot looking at the face
+VIEW_FRAMES = {
+    Direction.NORTH: ((0, 1), (1, 0), Direction.SOUTH),
+    Direction.SOUTH: ((0, -1), (1, 0), Direction.NORTH),
+    Direction.EAST: ((1, 0), (0, 1), Direction.WEST),
+    Direction.WEST: ((-1, 0), (0, 1), Direction.EAST),
+}
+
+# View offsets by (obstacle direction, retrying, scale), see get_view_offsets
+_view_offsets = dict()
+
+
+def get_view_offsets(direction: Direction, retrying, scale=1):
+    """Returns the view positions of VIEW_TEMPLATES relative to an obstacle facing the given direction
+
+    Args:
+        direction (Direction): direction the obstacle faces
+        retrying (bool): whether the robot is retrying to view the obstacles from further away
+        scale (int, optional): Number of cells of the grid per cell of CELL_SIZE. Defaults to 1.
+
+    Returns:
+        List[Tuple[int, int, Direction, int]]: (dx, dy, robot direction, penalty) of every view position, in cells of
+            the grid, none if the obstacle faces no direction
+    """
+    key = (direction, bool(retrying), scale)
+    if key not in _view_offsets:
+        offsets = []
+        if direction in VIEW_FRAMES:
+            (front_x, front_y), (along_x, along_y), robot_direction = VIEW_FRAMES[direction]
+            for front, along, penalty in VIEW_TEMPLATES[bool(retrying)]:
+                offsets.append((
+                    (front * front_x + along * along_x) * scale,
+                    (front * front_y + along * along_y) * scale,
+                    robot_direction,
+                    penalty * scale,
+                ))
+        _view_offsets[key] = offsets
+    return _view_offsets[key]
 
 
 class Grid:
     """
     Grid object that contains the size of the grid and a list of obstacles
     """
-    def __init__(self, size_x: int, size_y: int):
+    def __init__(self, size_x: int, size_y: int, scale=1):
         """
         Args:
             size_x (int): Size of the grid in the x direction
             size_y (int): Size of the grid in the y direction
+            scale (int, optional): Number of cells per cell of CELL_SIZE in each direction, the distances of the
+                clearance rules and view positions are scaled by it. Defaults to 1.
         """
         self.size_x = size_x
         self.size_y = size_y
+        self.scale = scale
         self.obstacles: List[Obstacle] = []
+        # Bumped whenever the obstacles change, so that anything derived from the grid can tell when it is stale
+        self.version = 0
+        # Rasters derived from the obstacles as nested lists, rebuilt lazily after every mutation
+        self._clearance = None
+        self._safe_cost = None
+        # View positions of the obstacles with the (version, retrying) they were generated for
+        self._view_positions = None
 
     def add_obstacle(self, obstacle: Obstacle):
         """Add a new obstacle to the Grid object, ignores if duplicate obstacle
@@ -310,12 +212,50 @@ class Grid:
 
         if to_add:
             self.obstacles.append(obstacle)
+            self._invalidate()
 
     def reset_obstacles(self):
         """
         Resets the obstacles in the grid
         """
         self.obstacles = []
+        self._invalidate()
+
+    def remove_obstacle(self, obstacle_id: int):
+        """Remove the obstacle with the given id from the Grid object
+
+        Args:
+            obstacle_id (int): ID of the obstacle to be removed
+
+        Returns:
+            Obstacle: the removed obstacle, None if there is no obstacle with that id
+        """
+        for idx, ob in enumerate(self.obstacles):
+            if ob.obstacle_id == obstacle_id:
+                del self.obstacles[idx]
+                self._invalidate()
+                return ob
+
+        return None
+
+    def update_obstacle(self, obstacle: Obstacle):
+        """Replace the obstacle with the same id as the given one, keeping its place in the list of obstacles.
+        Adds the obstacle if there is no obstacle with that id
+
+        Args:
+            obstacle (Obstacle): Obstacle to be updated
+
+        Returns:
+            Obstacle: the replaced obstacle, None if the obstacle was added
+        """
+        for idx, ob in enumerate(self.obstacles):
+            if ob.obstacle_id == obstacle.obstacle_id:
+                self.obstacles[idx] = obstacle
+                self._invalidate()
+                return ob
+
+        self.add_obstacle(obstacle)
+        return None
 
     def get_obstacles(self):
         """
@@ -323,53 +263,140 @@ class Grid:
         """
         return self.obstacles
 
+    def _invalidate(self):
+        """Drop the rasters after the obstacles have changed"""
+        self.version += 1
+        self._clearance = None
+        self._safe_cost = None
+
+    def _build_rasters(self):
+        """Build the clearance and safe cost rasters for the current obstacles
+
+        The clearance raster has one boolean layer per rule of `reachable` (plain, turn and preTurn), indexed as
+        [layer][x][y]. The safe cost raster holds the SAFE_COST band around every obstacle, indexed as [x][y].
+        Both are nested lists, as looking up single cells is what the searches do, and building them only visits
+        the cells around each obstacle. Distances of the rules are in cells of CELL_SIZE, so they are multiplied by
+        the scale of the grid.
+        """
+        k = self.scale
+        clearance = [
+            [[self.is_valid_coord(x, y) for y in range(self.size_y)] for x in range(self.size_x)]
+            for _ in range(3)
+        ]
+        safe_cost = [[0] * self.size_y for _ in range(self.size_x)]
+
+        for ob in self.obstacles:
+            # Must be at least 4 units away in total (x+y) to be unaffected by the obstacle, so only cells within
+            # 4 units less one cell in x and y can be affected
+            for x in range(max(ob.x - 4 * k + 1, 0), min(ob.x + 4 * k, self.size_x)):
+                for y in range(max(ob.y - 4 * k + 1, 0), min(ob.y + 4 * k, self.size_y)):
+                    dx = abs(x - ob.x)
+                    dy = abs(y - ob.y)
+                    near = dx + dy < 4 * k
+                    if ob.x == 4 * k and ob.y <= 4 * k and x < 4 * k and y < 4 * k:
+                        near = False
+                    furthest = max(dx, dy)
+                    if near and furthest < 2 * k:
+                        clearance[CLEARANCE_PLAIN][x][y] = False
+                    if near and furthest < (EXPANDED_CELL * 2 + 1) * k:
+                        clearance[CLEARANCE_TURN][x][y] = False
+                        clearance[CLEARANCE_PRE_TURN][x][y] = False
+                    if self._in_safe_cost_band(dx, dy):
+                        safe_cost[x][y] = SAFE_COST
+
+        self._clearance = clearance
+        self._safe_cost = safe_cost
+
+    def _in_safe_cost_band(self, dx: int, dy: int) -> bool:
+        # Cells (2, 2), (1, 2) and (2, 1) away from an obstacle, in cells of CELL_SIZE
+        k = self.scale
+        return 2 * k <= max(dx, dy) < 3 * k and min(dx, dy) >= k
+
+    def get_clearance_zone(self, obstacle: Obstacle):
+        """Returns the cells whose clearance or safe cost can depend on the given obstacle
+
+        Args:
+            obstacle (Obstacle): obstacle, which does not need to be in the grid
+
+        Returns:
+            Set[Tuple[int, int]]: (x, y) of the cells within the grid
+        """
+        k = self.scale
+        zone = set()
+        for x in range(max(obstacle.x - 4 * k + 1, 0), min(obstacle.x + 4 * k, self.size_x)):
+            for y in range(max(obstacle.y - 4 * k + 1, 0), min(obstacle.y + 4 * k, self.size_y)):
+                dx = abs(x - obstacle.x)
+                dy = abs(y - obstacle.y)
+                # Clearance rules only apply within 4 units in total (x+y), the safe cost band is within 2 units in x and y
+                if dx + dy < 4 * k or max(dx, dy) < 3 * k:
+                    zone.add((x, y))
+        return zone
+
+    def get_clearance_layers(self):
+        """Returns the clearance raster of the grid as nested lists, see `_build_rasters`. It must not be modified
+
+        Returns:
+            List[List[List[bool]]]: clearance indexed as [layer][x][y]
+        """
+        if self._clearance is None:
+            self._build_rasters()
+        return self._clearance
+
+    def get_safe_costs(self):
+        """Returns the safe cost raster of the grid as nested lists, see `_build_rasters`. It must not be modified
+
+        Returns:
+            List[List[int]]: safe cost indexed as [x][y]
+        """
+        if self._safe_cost is None:
+            self._build_rasters()
+        return self._safe_cost
+
     def reachable(self, x: int, y: int, turn=False, preTurn=False) -> bool:
         """Checks whether the given x,y coordinate is reachable/safe. Criterion is as such:
         - Must be at least 4 units away in total (x+y) from the obstacle
-        - Greater distance (x or y distance) must be at least 3 units away from obstacle
+        - Greater distance (x or y distance) must be at least 3 units away from obstacle when turning, 2 otherwise
 
         Args:
-            x (int): _description_
-            y (int): _description_
+            x (int): x-coordinate
+            y (int): y-coordinate
+            turn (bool, optional): Whether the robot ends a turn at the coordinate. Defaults to False.
+            preTurn (bool, optional): Whether the robot starts a turn at the coordinate. Defaults to False.
 
         Returns:
-            bool: _description_
+            bool: True if reachable, False otherwise
         """
-        
         if not self.is_valid_coord(x, y):
             return False
 
+        if preTurn:
+            layer = CLEARANCE_PRE_TURN
+        elif turn:
+            layer = CLEARANCE_TURN
+        else:
+            layer = CLEARANCE_PLAIN
+
+        return self.get_clearance_layers()[layer][x][y]
+
+    def get_safe_cost(self, x: int, y: int) -> int:
+        """Get the safe cost of a particular x,y coordinate wrt obstacles that are exactly 2 units away from it in both x and y directions
+
+        Args:
+            x (int): x-coordinate
+            y (int): y-coordinate
+
+        Returns:
+            int: safe cost
+        """
+        if 0 <= x < self.size_x and 0 <= y < self.size_y:
+            return self.get_safe_costs()[x][y]
+
+        # Outside of the raster, fall back to scanning the obstacles
         for ob in self.obstacles:
-            # print(f"Looking at position x:{x} y:{y} against ob: {ob.x} {ob.y}")
-            if ob.x == 4 and ob.y <= 4 and x < 4 and y < 4:
-                # print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered four bypass")
-                continue
-
-            # if x <= 3 and y <= 4:
-            #     continue
-
-            # Must be at least 4 units away in total (x+y)
-            if abs(ob.x - x) + abs(ob.y - y) >= 4:
-                # print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered more than 3 units bypass")
-                continue
-            # If max(x,y) is less than 3 units away, consider not reachable
-            # if max(abs(ob.x - x), abs(ob.y - y)) < EXPANDED_CELL * 2 + 1:
-            if turn:
-                if max(abs(ob.x - x), abs(ob.y - y)) < EXPANDED_CELL * 2 + 1:
-                    # if ob.x == 0 and ob.y == 10 and x == 1 and y == 12:
-                    #     print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered less than 3 max units trap")
-                    return False
-            if preTurn:
-                if max(abs(ob.x - x), abs(ob.y - y)) < EXPANDED_CELL * 2 + 1:
-                    # if ob.x == 0 and ob.y == 10 and x == 1 and y == 12:
-                    #     print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered less than 3 max units trap")
-                    return False
-            else:
-                if max(abs(ob.x - x), abs(ob.y - y)) < 2:
-                    # print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered less than 3 max units trap")
-                    return False
-
-        return True
+            if self._in_safe_cost_band(abs(ob.x - x), abs(ob.y - y)):
+                return SAFE_COST
+
+        return 0
 
     def is_valid_coord(self, x: int, y: int) -> bool:
         """Checks if given position is within bounds
@@ -381,10 +408,7 @@ class Grid:
         Returns:
             bool: True if valid, False otherwise
         """
-        if x < 1 or x >= self.size_x - 1 or y < 1 or y >= self.size_y - 1:
-            return False
-
-        return True
+        return is_valid(x, y, self.size_x, self.size_y, self.scale)
 
     def is_valid_cell_state(self, state: CellState) -> bool:
         """Checks if given state is within bounds
@@ -400,17 +424,26 @@ class Grid:
     def get_view_obstacle_positions(self, retrying) -> List[List[CellState]]:
         """
         This function return a list of desired states for the robot to achieve based on the obstacle position and direction.
-        The state is the position that the robot can see the image of the obstacle and is safe to reach without collision
-        :return: [[CellState]]
+        The state is the position that the robot can see the image of the obstacle and is safe to reach without collision.
+        The view positions of VIEW_TEMPLATES are looked up in the clearance raster for every obstacle, once per version
+        of the grid
+        :return: [[CellState]], one list per obstacle that faces a direction
         """
-        # print(f"Inside get_view_obstacle_positions: retrying = {retrying}")
-        optimal_positions = []
-        for obstacle in self.obstacles:
-            if obstacle.direction == 8:
-                continue
-            else:
-                view_states = [view_state for view_state in obstacle.get_view_state(
-                    retrying) if self.reachable(view_state.x, view_state.y)]
-            optimal_positions.append(view_states)
-
-        return optimal_positions
\ No newline at end of file
+        key = (self.version, bool(retrying))
+        if self._view_positions is None or self._view_positions[0] != key:
+            plain = self.get_clearance_layers()[CLEARANCE_PLAIN]
+            optimal_positions = []
+            for obstacle in self.obstacles:
+                if obstacle.direction == Direction.SKIP:
+                    continue
+                view_states = []
+                for dx, dy, robot_direction, penalty in get_view_offsets(obstacle.direction, retrying, self.scale):
+                    x, y = obstacle.x + dx, obstacle.y + dy
+                    # The clearance raster is False out of bounds, see _build_rasters
+                    if 0 <= x < self.size_x and 0 <= y < self.size_y and plain[x][y]:
+                        view_states.append(CellState(x, y, robot_direction, obstacle.obstacle_id, penalty))
+                optimal_positions.append(view_states)
+            self._view_positions = (key, optimal_positions)
+
+        # Copies of the lists, the states are shared by every call for this version
+        return [list(view_states) for view_states in self._view_positions[1]]
\ No newline at end of file
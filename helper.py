@@ -1,289 +1,189 @@
-from consts import WIDTH, HEIGHT, Direction
+from consts import CELL_SIZE, WIDTH, HEIGHT, Direction
 
 
-def is_valid(center_x: int, center_y: int):
+def is_valid(center_x: int, center_y: int, size_x=WIDTH, size_y=HEIGHT, scale=1):
     """Checks if given position is within bounds
 
     Inputs
     ------
     center_x (int): x-coordinate
     center_y (int): y-coordinate
+    size_x (int): size of the grid in the x direction
+    size_y (int): size of the grid in the y direction
+    scale (int): number of cells per cell of CELL_SIZE, the robot keeps one CELL_SIZE away from the walls
 
     Returns
     -------
     bool: True if valid, False otherwise
     """
     return (
-        center_x > 0 and center_y > 0 and center_x < WIDTH - 1 and center_y < HEIGHT - 1
+        scale <= center_x <= size_x - 2 * scale and scale <= center_y <= size_y - 2 * scale
     )
 
 
-def command_generator(states, obstacles):
+def format_distance(distance):
+    """Formats a distance in cm as the argument of a straight command, e.g. 10 -> "10", 5 -> "05", 7.5 -> "7.5"
+
+    Inputs
+    ------
+    distance (float): distance in cm
+
+    Returns
+    -------
+    str: the distance with at least two digits
     """
-    This function takes in a list of states and generates a list of commands for the robot to follow
+    if distance == int(distance):
+        return "{:02d}".format(int(distance))
+    return "{:g}".format(distance)
+
+
+# Turn commands by (previous direction, new direction, whether y increased). The turn command turns the robot 90
+# degrees: FR (forward right), FL (forward left), BR (backward right) and BL (backward left)
+TURN_COMMANDS = {
+    (Direction.NORTH, Direction.EAST, True): "FR",
+    (Direction.NORTH, Direction.EAST, False): "BL",
+    (Direction.NORTH, Direction.WEST, True): "FL",
+    (Direction.NORTH, Direction.WEST, False): "BR",
+    (Direction.EAST, Direction.NORTH, True): "FL",
+    (Direction.EAST, Direction.NORTH, False): "BR",
+    (Direction.EAST, Direction.SOUTH, True): "BL",
+    (Direction.EAST, Direction.SOUTH, False): "FR",
+    (Direction.SOUTH, Direction.EAST, True): "BR",
+    (Direction.SOUTH, Direction.EAST, False): "FL",
+    (Direction.SOUTH, Direction.WEST, True): "BL",
+    (Direction.SOUTH, Direction.WEST, False): "FR",
+    (Direction.WEST, Direction.NORTH, True): "FR",
+    (Direction.WEST, Direction.NORTH, False): "BL",
+    (Direction.WEST, Direction.SOUTH, True): "BR",
+    (Direction.WEST, Direction.SOUTH, False): "FL",
+}
+
+# (x, y) of a step forward in every direction, a straight move along it is FW and any other is BW
+HEADINGS = {
+    Direction.NORTH: (0, 1),
+    Direction.EAST: (1, 0),
+    Direction.SOUTH: (0, -1),
+    Direction.WEST: (-1, 0),
+}
+
+# Side of the picture by (obstacle direction, robot direction), for robots facing the obstacle: the coordinate
+# along the face of the obstacle, and the side when the obstacle's coordinate is greater or smaller than the robot's
+SNAP_SIDES = {
+    (Direction.WEST, Direction.EAST): ("y", "L", "R"),
+    (Direction.EAST, Direction.WEST): ("y", "R", "L"),
+    (Direction.NORTH, Direction.SOUTH): ("x", "L", "R"),
+    (Direction.SOUTH, Direction.NORTH): ("x", "R", "L"),
+}
+
+
+def snap_command(state, obstacle):
+    """Generates the command taking the picture of an obstacle from a state
 
     Inputs
     ------
-    states: list of State objects
-    obstacles: list of obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+    state: State object of the robot, with the screenshot id of the obstacle
+    obstacle: the obstacle, a dictionary with keys "x", "y", "d", and "id"
 
     Returns
     -------
-    commands: list of commands for the robot to follow
+    command: SC{id}L, SC{id}C or SC{id}R by the side of the robot the obstacle is on, None if the robot does not
+        face the obstacle
     """
+    sides = SNAP_SIDES.get((obstacle["d"], state.direction))
+    if sides is None:
+        return None
+
+    axis, greater, smaller = sides
+    obstacle_coord, robot_coord = obstacle[axis], getattr(state, axis)
+    if obstacle_coord > robot_coord:
+        return f"SC{state.screenshot_id}{greater}"
+    if obstacle_coord == robot_coord:
+        return f"SC{state.screenshot_id}C"
+    if obstacle_coord < robot_coord:
+        return f"SC{state.screenshot_id}{smaller}"
+    return f"SC{state.screenshot_id}"
+
+
+def iter_commands(states, obstacles, cell_size=CELL_SIZE, max_straight=90):
+    """
+    This function takes in states one at a time and yields the commands for the robot to follow, in a single pass.
+    Consecutive straight steps in the same direction are merged into one command as they come
 
-    # Convert the list of obstacles into a dictionary with key as the obstacle id and value as the obstacle
+    Inputs
+    ------
+    states: iterable of State objects, such as a list or a generator
+    obstacles: list of obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+    cell_size: size of the cells of the states in cm, which every straight step moves by
+    max_straight: longest straight command in cm, None to merge straight runs of any length
+
+    Yields
+    ------
+    command: the next command for the robot to follow, without the stop command (FIN)
+    """
     obstacles_dict = {ob["id"]: ob for ob in obstacles}
 
-    # Initialize commands list
-    commands = []
-
-    # Iterate through each state in the list of states
-    for i in range(1, len(states)):
-        steps = "90"
-
-        # If previous state and current state are the same direction,
-        if states[i].direction == states[i - 1].direction:
-            # Forward - Must be (east facing AND x value increased) OR (north facing AND y value increased)
-            if (
-                states[i].x > states[i - 1].x and states[i].direction == Direction.EAST
-            ) or (
-                states[i].y > states[i - 1].y and states[i].direction == Direction.NORTH
-            ):
-                commands.append("FW10")
-            # Forward - Must be (west facing AND x value decreased) OR (south facing AND y value decreased)
-            elif (
-                states[i].x < states[i - 1].x and states[i].direction == Direction.WEST
-            ) or (
-                states[i].y < states[i - 1].y and states[i].direction == Direction.SOUTH
-            ):
-                commands.append("FW10")
-            # Backward - All other cases where the previous and current state is the same direction
+    # Straight run not yielded yet, as "FW" or "BW" and its distance
+    run, run_distance = None, 0
+
+    states = iter(states)
+    prev = next(states, None)
+    for state in states:
+        if state.direction == prev.direction:
+            heading_x, heading_y = HEADINGS.get(state.direction, (0, 0))
+            move = "FW" if (state.x - prev.x) * heading_x + (state.y - prev.y) * heading_y > 0 else "BW"
+            if move == run and (max_straight is None or run_distance + cell_size <= max_straight):
+                run_distance += cell_size
             else:
-                commands.append("BW10")
-
-            # If any of these states has a valid screenshot ID, then add a SNAP command as well to take a picture
-            if states[i].screenshot_id != -1:
-                # NORTH = 0
-                # EAST = 2
-                # SOUTH = 4
-                # WEST = 6
-
-                current_ob_dict = obstacles_dict[
-                    states[i].screenshot_id
-                ]  # {'x': 9, 'y': 10, 'd': 6, 'id': 9}
-                current_robot_position = states[
-                    i
-                ]  # {'x': 1, 'y': 8, 'd': <Direction.NORTH: 0>, 's': -1}
-
-                # Obstacle facing WEST, robot facing EAST
-                if current_ob_dict["d"] == 6 and current_robot_position.direction == 2:
-                    if current_ob_dict["y"] > current_robot_position.y:
-                        commands.append(f"SC{states[i].screenshot_id}L")
-                    elif current_ob_dict["y"] == current_robot_position.y:
-                        commands.append(f"SC{states[i].screenshot_id}C")
-                    elif current_ob_dict["y"] < current_robot_position.y:
-                        commands.append(f"SC{states[i].screenshot_id}R")
-                    else:
-                        commands.append(f"SC{states[i].screenshot_id}")
-
-                # Obstacle facing EAST, robot facing WEST
-                elif (
-                    current_ob_dict["d"] == 2 and current_robot_position.direction == 6
-                ):
-                    if current_ob_dict["y"] > current_robot_position.y:
-                        commands.append(f"SC{states[i].screenshot_id}R")
-                    elif current_ob_dict["y"] == current_robot_position.y:
-                        commands.append(f"SC{states[i].screenshot_id}C")
-                    elif current_ob_dict["y"] < current_robot_position.y:
-                        commands.append(f"SC{states[i].screenshot_id}L")
-                    else:
-                        commands.append(f"SC{states[i].screenshot_id}")
-
-                # Obstacle facing NORTH, robot facing SOUTH
-                elif (
-                    current_ob_dict["d"] == 0 and current_robot_position.direction == 4
-                ):
-                    if current_ob_dict["x"] > current_robot_position.x:
-                        commands.append(f"SC{states[i].screenshot_id}L")
-                    elif current_ob_dict["x"] == current_robot_position.x:
-                        commands.append(f"SC{states[i].screenshot_id}C")
-                    elif current_ob_dict["x"] < current_robot_position.x:
-                        commands.append(f"SC{states[i].screenshot_id}R")
-                    else:
-                        commands.append(f"SC{states[i].screenshot_id}")
-
-                # Obstacle facing SOUTH, robot facing NORTH
-                elif (
-                    current_ob_dict["d"] == 4 and current_robot_position.direction == 0
-                ):
-                    if current_ob_dict["x"] > current_robot_position.x:
-                        commands.append(f"SC{states[i].screenshot_id}R")
-                    elif current_ob_dict["x"] == current_robot_position.x:
-                        commands.append(f"SC{states[i].screenshot_id}C")
-                    elif current_ob_dict["x"] < current_robot_position.x:
-                        commands.append(f"SC{states[i].screenshot_id}L")
-                    else:
-                        commands.append(f"SC{states[i].screenshot_id}")
-            continue
-
-        # If previous state and current state are not the same direction, it means that there will be a turn command involved
-        # Assume there are 4 turning command: FR, FL, BL, BR (the turn command will turn the robot 90 degrees)
-        # FR00 | FR30: Forward Right;
-        # FL00 | FL30: Forward Left;
-        # BR00 | BR30: Backward Right;
-        # BL00 | BL30: Backward Left;
-
-        # Facing north previously
-        if states[i - 1].direction == Direction.NORTH:
-            # Facing east afterwards
-            if states[i].direction == Direction.EAST:
-                # y value increased -> Forward Right
-                if states[i].y > states[i - 1].y:
-                    commands.append("FR{}".format(steps))
-                # y value decreased -> Backward Left
-                else:
-                    commands.append("BL{}".format(steps))
-            # Facing west afterwards
-            elif states[i].direction == Direction.WEST:
-                # y value increased -> Forward Left
-                if states[i].y > states[i - 1].y:
-                    commands.append("FL{}".format(steps))
-                # y value decreased -> Backward Right
-                else:
-                    commands.append("BR{}".format(steps))
-            else:
-                raise Exception("Invalid turing direction")
-
-        elif states[i - 1].direction == Direction.EAST:
-            if states[i].direction == Direction.NORTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append("FL{}".format(steps))
-                else:
-                    commands.append("BR{}".format(steps))
-
-            elif states[i].direction == Direction.SOUTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append("BL{}".format(steps))
-                else:
-                    commands.append("FR{}".format(steps))
-            else:
-                raise Exception("Invalid turing direction")
-
-        elif states[i - 1].direction == Direction.SOUTH:
-            if states[i].direction == Direction.EAST:
-                if states[i].y > states[i - 1].y:
-                    commands.append("BR{}".format(steps))
-                else:
-                    commands.append("FL{}".format(steps))
-            elif states[i].direction == Direction.WEST:
-                if states[i].y > states[i - 1].y:
-                    commands.append("BL{}".format(steps))
-                else:
-                    commands.append("FR{}".format(steps))
-            else:
-                raise Exception("Invalid turing direction")
-
-        elif states[i - 1].direction == Direction.WEST:
-            if states[i].direction == Direction.NORTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append("FR{}".format(steps))
-                else:
-                    commands.append("BL{}".format(steps))
-            elif states[i].direction == Direction.SOUTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append("BR{}".format(steps))
-                else:
-                    commands.append("FL{}".format(steps))
-            else:
-                raise Exception("Invalid turing direction")
+                if run is not None:
+                    yield run + format_distance(run_distance)
+                run, run_distance = move, cell_size
         else:
-            raise Exception("Invalid position")
-
-        # If any of these states has a valid screenshot ID, then add a SNAP command as well to take a picture
-        if states[i].screenshot_id != -1:
-            # NORTH = 0
-            # EAST = 2
-            # SOUTH = 4
-            # WEST = 6
-
-            current_ob_dict = obstacles_dict[
-                states[i].screenshot_id
-            ]  # {'x': 9, 'y': 10, 'd': 6, 'id': 9}
-            current_robot_position = states[
-                i
-            ]  # {'x': 1, 'y': 8, 'd': <Direction.NORTH: 0>, 's': -1}
-
-            # Obstacle facing WEST, robot facing EAST
-            if current_ob_dict["d"] == 6 and current_robot_position.direction == 2:
-                if current_ob_dict["y"] > current_robot_position.y:
-                    commands.append(f"SC{states[i].screenshot_id}L")
-                elif current_ob_dict["y"] == current_robot_position.y:
-                    commands.append(f"SC{states[i].screenshot_id}C")
-                elif current_ob_dict["y"] < current_robot_position.y:
-                    commands.append(f"SC{states[i].screenshot_id}R")
-                else:
-                    commands.append(f"SC{states[i].screenshot_id}")
-
-            # Obstacle facing EAST, robot facing WEST
-            elif current_ob_dict["d"] == 2 and current_robot_position.direction == 6:
-                if current_ob_dict["y"] > current_robot_position.y:
-                    commands.append(f"SC{states[i].screenshot_id}R")
-                elif current_ob_dict["y"] == current_robot_position.y:
-                    commands.append(f"SC{states[i].screenshot_id}C")
-                elif current_ob_dict["y"] < current_robot_position.y:
-                    commands.append(f"SC{states[i].screenshot_id}L")
-                else:
-                    commands.append(f"SC{states[i].screenshot_id}")
-
-            # Obstacle facing NORTH, robot facing SOUTH
-            elif current_ob_dict["d"] == 0 and current_robot_position.direction == 4:
-                if current_ob_dict["x"] > current_robot_position.x:
-                    commands.append(f"SC{states[i].screenshot_id}L")
-                elif current_ob_dict["x"] == current_robot_position.x:
-                    commands.append(f"SC{states[i].screenshot_id}C")
-                elif current_ob_dict["x"] < current_robot_position.x:
-                    commands.append(f"SC{states[i].screenshot_id}R")
-                else:
-                    commands.append(f"SC{states[i].screenshot_id}")
-
-            # Obstacle facing SOUTH, robot facing NORTH
-            elif current_ob_dict["d"] == 4 and current_robot_position.direction == 0:
-                if current_ob_dict["x"] > current_robot_position.x:
-                    commands.append(f"SC{states[i].screenshot_id}R")
-                elif current_ob_dict["x"] == current_robot_position.x:
-                    commands.append(f"SC{states[i].screenshot_id}C")
-                elif current_ob_dict["x"] < current_robot_position.x:
-                    commands.append(f"SC{states[i].screenshot_id}L")
-                else:
-                    commands.append(f"SC{states[i].screenshot_id}")
+            turn = TURN_COMMANDS.get((prev.direction, state.direction, state.y > prev.y))
+            if turn is None:
+                if prev.direction in HEADINGS:
+                    raise Exception("Invalid turing direction")
+                raise Exception("Invalid position")
+            if run is not None:
+                yield run + format_distance(run_distance)
+                run = None
+            yield turn + "90"
+
+        # If this state has a valid screenshot ID, then add a SNAP command as well to take a picture
+        if state.screenshot_id != -1:
+            command = snap_command(state, obstacles_dict[state.screenshot_id])
+            if command is not None:
+                if run is not None:
+                    yield run + format_distance(run_distance)
+                    run = None
+                yield command
+
+        prev = state
+
+    if run is not None:
+        yield run + format_distance(run_distance)
+
+
+def command_generator(states, obstacles, append_fin=True, cell_size=CELL_SIZE, max_straight=90):
+    """
+    This function takes in a list of states and generates a list of commands for the robot to follow, see
+    `iter_commands`
+
+    Inputs
+    ------
+    states: iterable of State objects
+    obstacles: list of obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+    append_fin: whether to end with the stop command (FIN), False to convert the path one leg at a time
+    cell_size: size of the cells of the states in cm, which every straight step moves by
+    max_straight: longest straight command in cm, None for firmware that takes straight moves of any length
+
+    Returns
+    -------
+    commands: list of commands for the robot to follow
+    """
+    commands = list(iter_commands(states, obstacles, cell_size, max_straight))
 
     # Final command is the stop command (FIN)
-    commands.append("FIN")
-
-    # Compress commands if there are consecutive forward or backward commands
-    compressed_commands = [commands[0]]
-
-    for i in range(1, len(commands)):
-        # If both commands are BW
-        if commands[i].startswith("BW") and compressed_commands[-1].startswith("BW"):
-            # Get the number of steps of previous command
-            steps = int(compressed_commands[-1][2:])
-            # If steps are not 90, add 10 to the steps
-            if steps != 90:
-                compressed_commands[-1] = "BW{}".format(steps + 10)
-                continue
-
-        # If both commands are FW
-        elif commands[i].startswith("FW") and compressed_commands[-1].startswith("FW"):
-            # Get the number of steps of previous command
-            steps = int(compressed_commands[-1][2:])
-            # If steps are not 90, add 10 to the steps
-            if steps != 90:
-                compressed_commands[-1] = "FW{}".format(steps + 10)
-                continue
-
-        # Otherwise, just add as usual
-        compressed_commands.append(commands[i])
-
-    return compressed_commands
+    if append_fin:
+        commands.append("FIN")
+
+    return commands
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from algo.cost_model import get_cost_model_name
+from consts import CELL_SIZE
+
+# Version of the planner and of the plans it returns, part of every key. Bump it whenever the same arena may be planned
+# differently or the plans change format, so that a persisted cache never serves the plans of an older planner
+# 2: plans are made with the swept robot footprint
+# 3: plans list the obstacles they skip
+PLANNER_VERSION = 3
+
+
+def plan_key(env_data, size_x=20, size_y=20, stream=False):
+    """Canonical hash of a planning request, identical for requests that describe the same arena
+
+    Inputs
+    ------
+    env_data: {"robot": {x, y, dir}, "obstacles": [{x, y, id, dir}], "big_turn" (optional), "retrying" (optional),
+        "cell_size" (optional), "cost_model" (optional)}
+    size_x: size of the grid in the x direction
+    size_y: size of the grid in the y direction
+    stream: whether the plan is cached by a streamed request, whose cached plans only hold the commands, distance
+        and path rather than everything `plan` returns
+
+    Raises
+    ------
+    ValueError: if the cost model is unknown, see `get_cost_model_name`
+
+    Returns
+    -------
+    key: hex digest of the arena and of PLANNER_VERSION
+    """
+    robot = env_data["robot"]
+    obstacles = sorted(
+        (ob["x"], ob["y"], ob["dir"], ob["id"]) for ob in env_data["obstacles"]
+    )
+    canonical = {
+        "version": PLANNER_VERSION,
+        "grid": [size_x, size_y],
+        "robot": [robot["x"], robot["y"], robot["dir"]],
+        "obstacles": obstacles,
+        "big_turn": int(env_data.get("big_turn") or 0),
+        "retrying": bool(env_data.get("retrying", False)),
+    }
+    # Only finer grids and other cost models add their options, so that the keys of the default grid only change with
+    # the planner version
+    cell_size = env_data.get("cell_size") or CELL_SIZE
+    if cell_size != CELL_SIZE:
+        canonical["cell_size"] = cell_size
+    # Validated like make_maze_solver does, so that a typo is an error instead of a new key for the same plan
+    cost_model = get_cost_model_name(env_data.get("cost_model"))
+    if cost_model != "steps":
+        canonical["cost_model"] = cost_model
+    if stream:
+        canonical["stream"] = True
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class PlanCache:
+    """
+    Least recently used cache of plans ({"commands", "distance", "path"}), keyed by `plan_key`.
+    Optionally persisted to a JSON file, which is loaded on creation and rewritten by `save`. Insertions only mark the
+    cache as dirty, so that the owner decides when the file is written, e.g. in batches away from an event loop.
+    """
+
+    def __init__(self, max_size=256, path=None):
+        """
+        Args:
+            max_size (int): Number of plans kept before the least recently used one is evicted
+            path (str): JSON file to persist the cache to, None to keep it in memory only
+        """
+        self.max_size = max_size
+        self.path = path
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Whether plans were inserted since the cache was last saved
+        self.dirty = False
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.plans)
+
+    def get(self, key):
+        """Returns the cached plan for the key and marks it as recently used, None if it is not cached"""
+        plan = self.plans.get(key)
+        if plan is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.plans.move_to_end(key)
+        return plan
+
+    def put(self, key, plan):
+        """Caches the plan for the key, evicting the least recently used plans if the cache is full"""
+        self.plans[key] = plan
+        self.plans.move_to_end(key)
+        while len(self.plans) > self.max_size:
+            self.plans.popitem(last=False)
+        self.dirty = True
+
+    def stats(self):
+        """Returns the size of the cache and its hit/miss counters"""
+        return {"size": len(self.plans), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+    def load(self):
+        """Loads the cache from its file. A file that cannot be read as a cache is ignored, starting empty"""
+        try:
+            with open(self.path) as f:
+                plans = json.load(f)
+            # Entries are saved from least to most recently used
+            self.plans = OrderedDict(plans[-self.max_size:] if self.max_size else [])
+            if not all(isinstance(plan, dict) for plan in self.plans.values()):
+                raise ValueError("Cached plans must be objects")
+        except (ValueError, TypeError) as e:
+            # Truncated, edited by hand or written in another format, the plans are planned again instead
+            print(f"Ignoring the plan cache {self.path}, it cannot be read: {e!r}")
+            self.plans = OrderedDict()
+
+    def save(self):
+        """Writes the cache to its file"""
+        self.write(self.snapshot())
+
+    def snapshot(self):
+        """Returns the entries to `write`, from least to most recently used, and marks the cache as saved"""
+        self.dirty = False
+        return list(self.plans.items())
+
+    def write(self, entries):
+        """Writes a `snapshot` to the file of the cache. Only reads the snapshot, so it can run in another thread"""
+        # Write to a temporary file first, so that a crash never leaves a truncated cache behind
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,219 @@
+from typing import List, Optional, Tuple
+from algo.algo import get_scale
+from algo.footprint import get_turn_sweep, occupancy_raster
+from consts import CELL_SIZE, HEIGHT, ROBOT_X, ROBOT_Y, TURN_DISPLACEMENTS, WIDTH, Direction
+from entities.Entity import CellState, get_view_offsets
+from helper import HEADINGS, TURN_COMMANDS, is_valid, snap_command
+
+
+def _build_turn_moves():
+    """Turns of the planner by (direction, turn command), see `MazeSolver.get_neighbors` and `TURN_COMMANDS`
+
+    Returns
+    -------
+    dict: (new direction, (x_big, x_small), (y_big, y_small)) by (direction, "FR", "FL", "BR" or "BL")
+    """
+    turn_moves = {}
+    for (direction, new_direction), displacements in TURN_DISPLACEMENTS.items():
+        for (x_big, x_small), (y_big, y_small) in displacements:
+            # The command of a turn only depends on whether y increases, which it does for any turning mode
+            command = TURN_COMMANDS[(direction, new_direction, y_big + y_small > 0)]
+            turn_moves[(direction, command)] = (new_direction, (x_big, x_small), (y_big, y_small))
+    return turn_moves
+
+
+TURN_MOVES = _build_turn_moves()
+
+# Displacement of the turns in cells of CELL_SIZE by turning mode, 3-1 (0) or 4-2 (1), see MazeSolver
+TURN_CHANGES = [(3, 1), (4, 2)]
+
+
+class SimulationResult:
+    """
+    Outcome of replaying the commands of a plan, see `ArenaSimulator.run`.
+
+    The trace holds the pose of the robot after every cell of a straight command and after every turn, starting with
+    the start pose, as (x, y, direction, screenshot id) with a screenshot id of -1 where no picture was taken.
+    Collisions are (command index, command, x, y) of the poses where the robot overlaps an obstacle or leaves the
+    arena, and of the ends of the turns whose swept footprint hits an obstacle. Missed snapshots are the ids of the
+    obstacles without a valid picture, which are pictures never taken as well as pictures taken from a pose that
+    cannot see the image or with the wrong side.
+    """
+
+    def __init__(self):
+        self.trace: List[Tuple[int, int, Direction, int]] = []
+        self.collisions: List[Tuple[int, str, int, int]] = []
+        self.missed_snapshots: List[int] = []
+        self.finished = False
+
+    @property
+    def ok(self) -> bool:
+        return self.finished and not self.collisions and not self.missed_snapshots
+
+    def as_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "finished": self.finished,
+            "collisions": [list(collision) for collision in self.collisions],
+            "missed_snapshots": list(self.missed_snapshots),
+        }
+
+
+class ArenaSimulator:
+    """
+    Headless model of the arena that replays the commands of `helper.command_generator`, without any delays.
+
+    The robot moves like the planner moves it: straight commands move it one cell at a time and turns displace it by
+    the 3-1 or 4-2 turn of its turning mode. The robot covers the 3 x 3 cells of CELL_SIZE around its position,
+    i.e. x - scale to x + 2 * scale - 1 on a grid of scale cells per cell of CELL_SIZE, and an obstacle covers the
+    scale x scale cells from its position, so that the robot overlaps an obstacle when it is less than 2 cells of
+    CELL_SIZE away from it in both x and y. The arena is held as one bitmask of y per x of the positions where the
+    robot overlaps an obstacle, so every pose is checked with a single lookup. Turns are also checked along the way,
+    by intersecting their swept footprint with the bitmasks of the obstacles, see `algo.footprint`.
+    """
+
+    def __init__(self, obstacles, size_x=WIDTH, size_y=HEIGHT, big_turn=0, cell_size=CELL_SIZE):
+        """
+        Args:
+            obstacles (list): obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+            size_x (int, optional): size of the grid in the x direction. Defaults to WIDTH.
+            size_y (int, optional): size of the grid in the y direction. Defaults to HEIGHT.
+            big_turn (int, optional): turning mode of the plans, 3-1 turn (0) or 4-2 turn (1). Defaults to 0.
+            cell_size (int, optional): size of a cell in cm, see MazeSolver. Defaults to CELL_SIZE.
+        """
+        self.size_x = size_x
+        self.size_y = size_y
+        self.cell_size = cell_size
+        self.scale = get_scale(cell_size)
+        bigger_change, smaller_change = TURN_CHANGES[int(big_turn)]
+        self.bigger_change = bigger_change * self.scale
+        self.smaller_change = smaller_change * self.scale
+        self.obstacles = {ob["id"]: ob for ob in obstacles}
+        self.raster = occupancy_raster([(ob["x"], ob["y"]) for ob in obstacles], size_x, size_y, self.scale)
+
+        # Positions where the robot overlaps an obstacle, bit y of blocked[x]
+        k = self.scale
+        self.blocked = [0] * size_x
+        for ob in obstacles:
+            low_y = max(ob["y"] - 2 * k + 1, 0)
+            column = ((1 << (ob["y"] + 2 * k - low_y)) - 1) << low_y
+            for x in range(max(ob["x"] - 2 * k + 1, 0), min(ob["x"] + 2 * k, size_x)):
+                self.blocked[x] |= column
+
+        # Robot poses that see the image of each obstacle, see Obstacle.get_view_state
+        self.view_poses = {}
+        for ob in obstacles:
+            if ob["d"] == Direction.SKIP:
+                continue
+            self.view_poses[ob["id"]] = {
+                (ob["x"] + dx, ob["y"] + dy, robot_direction)
+                for retrying in (False, True)
+                for dx, dy, robot_direction, _ in get_view_offsets(ob["d"], retrying, k)
+            }
+
+    def collides(self, x: int, y: int) -> bool:
+        """Checks if the robot overlaps an obstacle or leaves the arena at the given position
+
+        Args:
+            x (int): x-coordinate of the robot
+            y (int): y-coordinate of the robot
+
+        Returns:
+            bool: True if the robot collides, False otherwise
+        """
+        if not is_valid(x, y, self.size_x, self.size_y, self.scale):
+            return True
+        return bool(self.blocked[x] >> y & 1)
+
+    def run(
+        self, commands, robot_x=ROBOT_X, robot_y=ROBOT_Y, robot_direction=Direction.NORTH
+    ) -> SimulationResult:
+        """Replay the commands of a plan from the start pose of the robot
+
+        Args:
+            commands (Iterable[str]): commands of the plan, see `helper.command_generator`
+            robot_x (int, optional): start x-coordinate of the robot, in cells of the grid. Defaults to ROBOT_X.
+            robot_y (int, optional): start y-coordinate of the robot, in cells of the grid. Defaults to ROBOT_Y.
+            robot_direction (Direction, optional): start direction of the robot. Defaults to Direction.NORTH.
+
+        Raises:
+            ValueError: if a command is unknown, or a straight command does not move a whole number of cells
+
+        Returns:
+            SimulationResult: trace of the robot, collisions and missed snapshots of the plan
+        """
+        result = SimulationResult()
+        trace, collisions = result.trace, result.collisions
+        snapped = set()
+        x, y, direction = robot_x, robot_y, Direction(robot_direction)
+        trace.append((x, y, direction, -1))
+
+        for index, command in enumerate(commands):
+            if result.finished:
+                raise ValueError(f"Command {command} after FIN")
+            if command == "FIN":
+                result.finished = True
+            elif command[:2] in ("FW", "BW"):
+                cells = float(command[2:]) / self.cell_size
+                if cells != int(cells):
+                    raise ValueError(f"{command} does not move a whole number of cells of {self.cell_size} cm")
+                heading_x, heading_y = HEADINGS[direction]
+                if command[:2] == "BW":
+                    heading_x, heading_y = -heading_x, -heading_y
+                for _ in range(int(cells)):
+                    x, y = x + heading_x, y + heading_y
+                    trace.append((x, y, direction, -1))
+                    if self.collides(x, y):
+                        collisions.append((index, command, x, y))
+            elif command[:2] in ("FR", "FL", "BR", "BL") and command[2:] == "90":
+                new_direction, (x_big, x_small), (y_big, y_small) = TURN_MOVES[(direction, command[:2])]
+                dx = x_big * self.bigger_change + x_small * self.smaller_change
+                dy = y_big * self.bigger_change + y_small * self.smaller_change
+                sweep = get_turn_sweep(direction, new_direction, dx, dy, self.scale)
+                hits = sweep.hits(self.raster, x, y)
+                x, y, direction = x + dx, y + dy, new_direction
+                trace.append((x, y, direction, -1))
+                if hits or self.collides(x, y):
+                    collisions.append((index, command, x, y))
+            elif command.startswith("SC"):
+                obstacle_id = self._check_snapshot(command, x, y, direction)
+                if obstacle_id is not None:
+                    snapped.add(obstacle_id)
+                    trace[-1] = (x, y, direction, obstacle_id)
+            else:
+                raise ValueError(f"Unknown command {command}")
+
+        result.missed_snapshots = [obstacle_id for obstacle_id in self.view_poses if obstacle_id not in snapped]
+        return result
+
+    def _check_snapshot(self, command: str, x: int, y: int, direction: Direction) -> Optional[int]:
+        """Returns the id of the obstacle that a picture command captures from a pose, None if it misses it"""
+        obstacle_id = command[2:].rstrip("LCR")
+        if not obstacle_id.isdigit() or int(obstacle_id) not in self.view_poses:
+            return None
+        obstacle_id = int(obstacle_id)
+        if (x, y, direction) not in self.view_poses[obstacle_id]:
+            return None
+        # The side of the picture must be the one the planner would send from this pose
+        if snap_command(CellState(x, y, direction, obstacle_id), self.obstacles[obstacle_id]) != command:
+            return None
+        return obstacle_id
+
+
+def simulate(
+    commands, obstacles, size_x=WIDTH, size_y=HEIGHT, big_turn=0, cell_size=CELL_SIZE
+) -> SimulationResult:
+    """Replay the commands of a plan from the default start pose, see `ArenaSimulator`
+
+    Args:
+        commands (Iterable[str]): commands of the plan, see `helper.command_generator`
+        obstacles (list): obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+        size_x (int, optional): size of the grid in the x direction. Defaults to WIDTH.
+        size_y (int, optional): size of the grid in the y direction. Defaults to HEIGHT.
+        big_turn (int, optional): turning mode of the plan, 3-1 turn (0) or 4-2 turn (1). Defaults to 0.
+        cell_size (int, optional): size of a cell in cm. Defaults to CELL_SIZE.
+
+    Returns:
+        SimulationResult: trace of the robot, collisions and missed snapshots of the plan
+    """
+    return ArenaSimulator(obstacles, size_x, size_y, big_turn, cell_size).run(commands)
@@ -2,13 +2,19 @@ import tkinter as tk
 from consts import OBS_DIM, Direction, WIDTH, HEIGHT, ROBOT_X, ROBOT_Y
 from algo.algo import MazeSolver
 from helper import command_generator
+from simulation import simulate
 import time
 
 
 class CarSimulator:
-    def __init__(self, grid_size=600, cell_size=30):
+    """Tkinter view of the arena, which renders the plans replayed by `simulation.ArenaSimulator`"""
+
+    def __init__(self, grid_size=600, cell_size=30, step_delay=0.5, snap_delay=1.0):
         self.grid_size = grid_size
         self.cell_size = cell_size
+        # Seconds to show every step and picture of a replay for, 0 to fast forward
+        self.step_delay = step_delay
+        self.snap_delay = snap_delay
         self.root = tk.Tk()
         self.root.title("Car Simulator")
         self.canvas = tk.Canvas(
@@ -181,7 +187,7 @@ class CarSimulator:
             car_blocks[1], fill="red"
         )  # Camera indicates picture taken
         self.root.update()
-        time.sleep(1)  # Pause for 1 second to take picture
+        time.sleep(self.snap_delay)  # Pause to take picture
         self.canvas.itemconfig(car_blocks[1], fill="yellow")
 
     def update_obstacle_image(self, key, img_id, direction_var):
@@ -335,21 +341,24 @@ class CarSimulator:
         commands = command_generator(optimal_path, obstacles_json)
         print(f"Commands: {commands}")
 
-        # Move the car along the optimal path
-        for step in optimal_path:
-            x = step.x
-            y = step.y
-            direction = step.direction
+        # Replay the commands on the arena model, then show the robot following them
+        result = simulate(commands, obstacles_json)
+        print(f"Simulation: {result.as_dict()}")
+        self.render(result)
+
+    def render(self, result):
+        """Move the car along the trace of a replayed plan, see `simulation.SimulationResult`"""
+        for x, y, direction, screenshot_id in result.trace:
             self.update_car_position(x, y, direction)
 
-            # Simulate camera action randomly for demonstration
-            if step.screenshot_id != -1:
+            if screenshot_id != -1:
                 self.simulate_camera_action(direction)
 
             self.root.update()
-            time.sleep(0.5)  # Simulate time delay between movements
+            time.sleep(self.step_delay)  # Simulate time delay between movements
 
 
 # Create the Car Simulator and run the GUI
-simulator = CarSimulator()
-simulator.root.mainloop()
+if __name__ == "__main__":
+    simulator = CarSimulator()
+    simulator.root.mainloop()